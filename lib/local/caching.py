@@ -1,12 +1,33 @@
 import os
+import io
+import sys
+import inspect
+import functools
 import pickle
 import gzip
 import json
+import mmap
+import struct
+import zipfile
 import sqlite3
+import uuid
+import socket
+import hashlib
+import time
+import queue
+import atexit
+import threading
+import importlib.util
 from pathlib import Path
-from io import BytesIO
-from typing import Callable, TypeVar
+from dataclasses import dataclass
+from types import CodeType, ModuleType
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from typing import Any, Callable, Iterable, TypeVar
+import numpy as np
+import pandas as pd
 from .constants import EXECUTION_DIR, WORKSPACE_ROOT
+from .utils import batchify, imap_batches
 
 ############################## pickling ##############################
 
@@ -23,100 +44,1328 @@ def _get_paths(fname: str, alt=None):
     fpath = f'{cache}/{fname}'
     return fpath, cache
 
-def _ext_to_fpaths(fpath: str, compression=False):
-    EXT = '.pkl.gz' if compression else '.pkl'
+def _ext_to_fpaths(fpath: str, compression=False, ext: str|None=None):
+    EXT = ext if ext is not None else '.pkl.gz' if compression else '.pkl'
     fpath = fpath.replace(EXT, '')
     fpath += EXT
-    fpath_str = fpath.replace(str(WORKSPACE_ROOT), "{WORKSPACE}") # for logging
-    return fpath, fpath_str
+    return fpath, _fpath_str(fpath)
+
+def _fpath_str(fpath: str):
+    return fpath.replace(str(WORKSPACE_ROOT), "{WORKSPACE}") # for logging
+
+############################## metrics ##############################
+
+_metrics: dict[tuple[str, str], dict[str, float]] = {}
+_metrics_lock = threading.Lock()
+_metrics_log: Path|None = None
+
+def set_metrics_log(path: Path|str|None):
+    """also append every recorded event to this file, as JSON lines"""
+    global _metrics_log
+    _metrics_log = Path(path) if path is not None else None
+
+def reset_metrics():
+    with _metrics_lock:
+        _metrics.clear()
+
+def _record(op: str, name: str, **counts: float):
+    with _metrics_lock:
+        m = _metrics.setdefault((op, name), {})
+        for k, v in counts.items():
+            m[k] = m.get(k, 0)+v
+        if _metrics_log is not None:
+            with open(_metrics_log, 'a') as log:
+                log.write(json.dumps(dict(time=time.time(), op=op, name=name)|counts)+'\n')
+
+def metrics_snapshot() -> dict[str, dict[str, dict[str, float]]]:
+    """{op: {name: counters}} for save, load, cache, DictCache & cache_fn_result"""
+    snapshot = {}
+    with _metrics_lock:
+        for (op, name), m in _metrics.items():
+            snapshot.setdefault(op, {})[name] = m.copy()
+    return snapshot
+
+def metrics_frame() -> pd.DataFrame:
+    rows = [dict(op=op, name=name)|m for op, names in metrics_snapshot().items() for name, m in names.items()]
+    df = pd.DataFrame(rows)
+    if len(df) == 0: return df
+    for c in ['hits', 'misses', 'bytes_read', 'bytes_written', 'raw_bytes']:
+        if c not in df.columns: df[c] = 0
+    df = df.fillna(0)
+    stored = df['bytes_read']+df['bytes_written']
+    df['compression_ratio'] = (df['raw_bytes']/stored).where(stored > 0)
+    return df.sort_values(df.columns.intersection(['seconds_total']).tolist() or ['op'], ascending=False).reset_index(drop=True)
+
+class _IOStats:
+    def __init__(self) -> None:
+        self.seconds = dict(io=0.0, stream=0.0)
+        self.bytes = dict(io=0, stream=0)
+
+    def phases(self, total: float, stored: int):
+        """split the total into serializing, (de)compressing & file IO"""
+        io_s, stream_s = self.seconds['io'], self.seconds['stream']
+        return dict(
+            raw_bytes = self.bytes['stream'] if self.bytes['stream'] > 0 else stored,
+            seconds_total = total,
+            seconds_serialize = max(total-max(stream_s, io_s), 0),
+            seconds_compress = max(stream_s-io_s, 0),
+            seconds_io = io_s,
+        )
+
+_io_stats = threading.local()
+
+class _Timed:
+    """
+    file wrapper that adds the time spent in it, and the bytes passed through it,
+    to the _IOStats of the save or load in progress on this thread
+    """
+    def __init__(self, f, layer: str) -> None:
+        self._f = f
+        self._layer = layer
+
+    def __getattr__(self, k):
+        return getattr(self._f, k)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._f.close()
+
+    def _add(self, t: float, n: int):
+        stats: _IOStats|None = getattr(_io_stats, 'current', None)
+        if stats is None: return
+        stats.seconds[self._layer] += time.perf_counter()-t
+        stats.bytes[self._layer] += n
+
+    def write(self, b):
+        t = time.perf_counter()
+        r = self._f.write(b)
+        self._add(t, memoryview(b).nbytes)
+        return r
+
+    def read(self, *args):
+        t = time.perf_counter()
+        r = self._f.read(*args)
+        self._add(t, len(r))
+        return r
+
+    def readline(self, *args):
+        t = time.perf_counter()
+        r = self._f.readline(*args)
+        self._add(t, len(r))
+        return r
+
+    def readinto(self, b):
+        t = time.perf_counter()
+        r = self._f.readinto(b)
+        self._add(t, r or 0)
+        return r
+
+############################## codecs ##############################
+
+@dataclass
+class Codec:
+    """
+    dump(x, fpath, level) writes x to fpath, load(fpath) reads it back.
+    files are matched to codecs by their leading magic bytes, not their extension.
+    codecs with accepts(x) are picked automatically by save() for the objects they take,
+    and if partial, load(fpath, columns=, filters=) reads only the requested subset.
+    describe(x) adds entries to the metadata sidecar
+    """
+    name: str
+    ext: str
+    magic: bytes
+    dump: Callable[[Any, str, int], None]
+    load: Callable[..., Any]
+    compressed: bool = True
+    accepts: Callable[[Any], bool]|None = None
+    partial: bool = False
+    describe: Callable[[Any], dict]|None = None
+
+CODECS: dict[str, Codec] = {}
+def register_codec(codec: Codec):
+    CODECS[codec.name] = codec
+
+_default_codec = 'gzip'
+def set_default_codec(name: str):
+    global _default_codec
+    assert name in CODECS, f"unknown codec [{name}], options are {list(CODECS)}"
+    _default_codec = name
+
+def _detect_codec(fpath: str) -> Codec:
+    with open(fpath, 'rb') as f:
+        header = f.read(16)
+    for codec in sorted(CODECS.values(), key=lambda c: len(c.magic), reverse=True):
+        if header.startswith(codec.magic): return codec
+    raise ValueError(f"unrecognized cache format for [{fpath}]")
+
+def _find_cached(fpath_no_ext: str) -> str|None:
+    candidates = {_ext_to_fpaths(fpath_no_ext, ext=c.ext)[0] for c in CODECS.values()}
+    candidates = [f for f in candidates if os.path.isfile(f)]
+    if len(candidates) == 0: return None
+    return max(candidates, key=os.path.getmtime)
+
+# codecs open files through _open() and hand pickle a _Timed(..., "stream") so
+# that time is split between serializing, compressing & file IO, see metrics
+def _open(fpath: str, mode: str):
+    return _Timed(open(fpath, mode), "io")
+
+# gzip, the stdlib fallback
+def _gzip_dump(x, fpath: str, level: int):
+    with _open(fpath, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=level) as f:
+        pickle.dump(x, _Timed(f, "stream"), protocol=pickle.HIGHEST_PROTOCOL)
+
+def _gzip_load(fpath: str):
+    with _open(fpath, "rb") as raw, gzip.GzipFile(fileobj=raw, mode="rb") as f:
+        return pickle.load(_Timed(f, "stream"))
+
+# pickles written with compression_level=0 before codecs existed
+def _pickle_dump(x, fpath: str, level: int):
+    with _open(fpath, 'wb') as f:
+        pickle.dump(x, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def _pickle_load(fpath: str):
+    with _open(fpath, 'rb') as f:
+        return pickle.load(f)
+
+# protocol 5 with out-of-band buffers, so large arrays are written & read
+# as raw contiguous blocks instead of being copied through the pickle stream
+_PICKLE5_MAGIC = b'PKL5OOB\x00'
+_PICKLE5_ALIGN = 64
+def _pickle5_dump(x, fpath: str, level: int):
+    buffers: list[pickle.PickleBuffer] = []
+    data = pickle.dumps(x, protocol=5, buffer_callback=buffers.append)
+    raws = [b.raw() for b in buffers]
+    with _open(fpath, 'wb') as f:
+        f.write(_PICKLE5_MAGIC)
+        f.write(struct.pack(f'<QQ{len(raws)}Q', len(data), len(raws), *[r.nbytes for r in raws]))
+        f.write(data)
+        for r in raws:
+            f.write(b'\x00'*(-f.tell() % _PICKLE5_ALIGN))
+            f.write(r)
+
+def _pickle5_load(fpath: str):
+    # buffers are copy-on-write views of the mapped file, so opening is instant regardless of size,
+    # pages are shared between processes through the OS cache and only copied if written to
+    with open(fpath, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    view = memoryview(mm)
+    pos = len(_PICKLE5_MAGIC)
+    data_len, nbuf = struct.unpack_from('<QQ', mm, pos)
+    pos += 16
+    lens = struct.unpack_from(f'<{nbuf}Q', mm, pos)
+    pos += 8*nbuf
+    data = view[pos:pos+data_len]
+    pos += data_len
+    buffers = []
+    for l in lens:
+        pos += -pos % _PICKLE5_ALIGN
+        buffers.append(view[pos:pos+l])
+        pos += l
+    return pickle.loads(data, buffers=buffers)
+
+MMAP_THRESHOLD = 64*2**20
+def _pickle5_accepts(x):
+    # objects carrying large arrays, like OmicSet.mat, are worth keeping uncompressed and mapped
+    if isinstance(x, dict): members = x.values()
+    elif isinstance(x, (list, tuple)): members = x
+    elif hasattr(x, '__dict__'): members = vars(x).values()
+    else: return False
+    return sum(m.nbytes for m in members if isinstance(m, np.ndarray)) >= MMAP_THRESHOLD
+
+# raw .npy buffers for arrays, loaded as read-only np.memmap
+def _npy_accepts(x):
+    return isinstance(x, np.ndarray) and not x.dtype.hasobject
+
+def _npy_describe(x: np.ndarray):
+    return dict(array=dict(shape=list(x.shape), dtype=str(x.dtype), fortran_order=bool(x.flags.f_contiguous and not x.flags.c_contiguous)))
+
+def _npy_dump(x: np.ndarray, fpath: str, level: int):
+    with _open(fpath, 'wb') as f:
+        np.save(f, x, allow_pickle=False)
+
+def _npy_load(fpath: str):
+    return np.load(fpath, mmap_mode='r', allow_pickle=False)
+
+# zstandard (optional dependency), compresses frames on all cores
+def _zstd_dump(x, fpath: str, level: int):
+    import zstandard
+    cctx = zstandard.ZstdCompressor(level=level, threads=-1)
+    with _open(fpath, 'wb') as f, cctx.stream_writer(f, closefd=False) as w:
+        pickle.dump(x, _Timed(w, "stream"), protocol=pickle.HIGHEST_PROTOCOL)
+
+def _zstd_load(fpath: str):
+    import zstandard
+    dctx = zstandard.ZstdDecompressor()
+    with _open(fpath, 'rb') as f, io.BufferedReader(dctx.stream_reader(f, closefd=False), buffer_size=1<<20) as r:
+        return pickle.load(_Timed(r, "stream"))
+
+# columnar parquet for DataFrames (optional dependency on pyarrow), each column compressed separately
+# picked automatically only for columns that come back exactly as they were,
+# other frames (e.g. with tuple or set cells) need an explicit codec='parquet'
+def _parquet_lossless(col: pd.Series|pd.Index):
+    dtype = col.dtype
+    if isinstance(dtype, pd.CategoricalDtype): return _parquet_lossless(dtype.categories)
+    if isinstance(dtype, (pd.StringDtype, pd.DatetimeTZDtype)): return True
+    if dtype.kind in 'biufmM': return True
+    if dtype.kind == 'O': return all(isinstance(v, str) for v in col if v is not None and v == v)
+    return False
+
+def _parquet_accepts(x):
+    if not isinstance(x, pd.DataFrame): return False
+    if importlib.util.find_spec('pyarrow') is None: return False
+    if isinstance(x.columns, pd.MultiIndex) or not all(isinstance(c, str) for c in x.columns): return False
+    if isinstance(x.index, pd.MultiIndex) or not _parquet_lossless(x.index): return False
+    return all(_parquet_lossless(x[c]) for c in x.columns) and x.columns.is_unique
+
+def _parquet_dump(x: pd.DataFrame, fpath: str, level: int):
+    with _open(fpath, 'wb') as f:
+        x.to_parquet(f, engine='pyarrow', compression='zstd', compression_level=max(level, 1))
+
+def _parquet_load(fpath: str, columns: list[str]|None=None, filters: list|None=None):
+    return pd.read_parquet(fpath, engine='pyarrow', columns=columns, filters=filters)
+
+def _apply_filters(df: pd.DataFrame, filters: list):
+    """same [(col, op, val), ...] or [[(col, op, val), ...], ...] (OR of ANDs) form as pd.read_parquet"""
+    OPS = {
+        '==': lambda c, v: c == v, '=': lambda c, v: c == v, '!=': lambda c, v: c != v,
+        '<': lambda c, v: c < v, '<=': lambda c, v: c <= v,
+        '>': lambda c, v: c > v, '>=': lambda c, v: c >= v,
+        'in': lambda c, v: c.isin(v), 'not in': lambda c, v: ~c.isin(v),
+    }
+    if len(filters) > 0 and isinstance(filters[0], tuple): filters = [filters]
+    mask = pd.Series(False, index=df.index)
+    for conjunction in filters:
+        _m = pd.Series(True, index=df.index)
+        for col, op, val in conjunction:
+            _m &= OPS[op](df[col], val)
+        mask |= _m
+    return df[mask]
+
+# bundles, several objects in one zip with an index, each unpickled only when first accessed
+_BUNDLE_INDEX = '__index__.json'
+def _bundle_dump(x: dict[str, Any], fpath: str, level: int):
+    assert isinstance(x, dict) and all(isinstance(k, str) for k in x), "bundles are saved from a dict of str -> object"
+    compression = zipfile.ZIP_DEFLATED if level > 0 else zipfile.ZIP_STORED
+    with _open(fpath, 'wb') as raw, zipfile.ZipFile(raw, 'w', compression=compression, compresslevel=level or None) as z:
+        for k, v in x.items():
+            with z.open(k, 'w', force_zip64=True) as f:
+                pickle.dump(v, _Timed(f, "stream"), protocol=pickle.HIGHEST_PROTOCOL)
+        z.writestr(_BUNDLE_INDEX, json.dumps(list(x)))
+
+def _bundle_load(fpath: str):
+    return Bundle(fpath)
+
+class Bundle:
+    """
+    members are read from the bundle on first access, by attribute, key or position.
+    iterating yields members in the order they were saved, so a bundle unpacks like a tuple
+    """
+    def __init__(self, fpath: str) -> None:
+        # the zip is held open, so later saves to the same name (which replace the file) don't affect this bundle
+        self._fpath = fpath
+        self._zip = zipfile.ZipFile(fpath)
+        self._keys: list[str] = json.loads(self._zip.read(_BUNDLE_INDEX))
+        self._loaded: dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def keys(self):
+        return list(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, k):
+        return k in self._keys
+
+    def __iter__(self):
+        for k in self._keys:
+            yield self[k]
+
+    def __getitem__(self, k: str|int):
+        if isinstance(k, int): k = self._keys[k]
+        if k not in self._keys: raise KeyError(k)
+        with self._lock:
+            if k not in self._loaded:
+                t = time.perf_counter()
+                self._loaded[k] = pickle.loads(self._zip.read(k))
+                size = self._zip.getinfo(k).compress_size
+                _record('load', f'{Path(self._fpath).name}:{k}', calls=1, hits=1, bytes_read=size, seconds_total=time.perf_counter()-t)
+            return self._loaded[k]
+
+    def __getattr__(self, k: str):
+        if k.startswith('_'): raise AttributeError(k)
+        try:
+            return self[k]
+        except KeyError:
+            raise AttributeError(f"bundle has no member [{k}], options are {self._keys}")
+
+    def __getstate__(self):
+        return self._fpath
+
+    def __setstate__(self, fpath: str):
+        self.__init__(fpath)
+
+    def __repr__(self) -> str:
+        return f"Bundle({self._keys}, loaded={list(self._loaded)})"
+
+register_codec(Codec('gzip', '.pkl.gz', b'\x1f\x8b', _gzip_dump, _gzip_load))
+register_codec(Codec('pickle', '.pkl', b'\x80', _pickle_dump, _pickle_load, compressed=False))
+register_codec(Codec('zstd', '.pkl.zst', b'\x28\xb5\x2f\xfd', _zstd_dump, _zstd_load))
+register_codec(Codec('parquet', '.parquet', b'PAR1', _parquet_dump, _parquet_load, accepts=_parquet_accepts, partial=True))
+register_codec(Codec('npy', '.npy', b'\x93NUMPY', _npy_dump, _npy_load, compressed=False, accepts=_npy_accepts, describe=_npy_describe))
+register_codec(Codec('bundle', '.bundle', b'PK\x03\x04', _bundle_dump, _bundle_load))
+register_codec(Codec('pickle5', '.pkl', _PICKLE5_MAGIC, _pickle5_dump, _pickle5_load, compressed=False, accepts=_pickle5_accepts))
+
+############################## background writes ##############################
+
+@dataclass
+class _InFlight:
+    x: Any
+    future: Future
+    fingerprint: str|None = None
+
+_background_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cache-writer')
+_inflight: dict[str, _InFlight] = {}
+_inflight_lock = threading.Lock()
+_background_errors: list[BaseException] = []
+
+def _write_behind(fpath_no_ext: str, x, job: Callable[[], None], fingerprint: str|None=None):
+    entry = _InFlight(x, _background_writer.submit(job), fingerprint)
+    with _inflight_lock:
+        _inflight[fpath_no_ext] = entry
+    def _done(future: Future):
+        with _inflight_lock:
+            if _inflight.get(fpath_no_ext) is entry: del _inflight[fpath_no_ext]
+        e = future.exception()
+        if e is not None:
+            print(f'background write to [{_fpath_str(fpath_no_ext)}] failed with [{e}]')
+            _background_errors.append(e)
+    entry.future.add_done_callback(_done)
+
+def _get_inflight(fpath_no_ext: str):
+    with _inflight_lock:
+        return _inflight.get(fpath_no_ext)
+
+def _wait_inflight(fpath_no_ext: str):
+    entry = _get_inflight(fpath_no_ext)
+    if entry is not None: wait([entry.future])
+
+@atexit.register
+def flush():
+    """waits for all background writes to finish, raising the first error if any failed"""
+    with _inflight_lock:
+        pending = [e.future for e in _inflight.values()]
+    wait(pending)
+    if len(_background_errors) > 0:
+        e = _background_errors[0]
+        _background_errors.clear()
+        raise e
+
+############################## save & load ##############################
 
 def save_exists(name: str, alt_workspace=None):
     fpath_no_ext, cache = _get_paths(name, alt_workspace)
-    fpath_comp, fpath_str_comp = _ext_to_fpaths(fpath_no_ext, compression=True)
-    fpath, fpath_str = _ext_to_fpaths(fpath_no_ext, compression=True)
-    return os.path.exists(fpath) or os.path.exists(fpath_comp)
+    return _get_inflight(fpath_no_ext) is not None or _find_cached(fpath_no_ext) is not None
+
+def save(name, x, alt_workspace=None, compression_level=1, silent=False, codec: str|None=None, background=False):
+    """
+    codec defaults to the first registered codec that accepts x (e.g. parquet for DataFrames),
+    then the one set by set_default_codec(), or pickle5 if compression_level is 0.
+    if background, x is handed to a writer thread and this returns immediately.
+    x must not be modified until the write completes, see flush()
+    """
+    fpath_no_ext, cache = _get_paths(name, alt_workspace)
+    if background:
+        if not silent: print(f'caching data in the background to [{_fpath_str(fpath_no_ext)}]')
+        _write_behind(fpath_no_ext, x, lambda: _save(name, x, alt_workspace, compression_level, True, codec))
+        return
+    _wait_inflight(fpath_no_ext) # or an older background write could land on top of this one
+    _save(name, x, alt_workspace, compression_level, silent, codec)
 
-def save(name, x, alt_workspace=None, compression_level=1, silent=False):
+def _save(name, x, alt_workspace, compression_level, silent, codec):
     fpath_no_ext, cache = _get_paths(name, alt_workspace)
-    if not os.path.isdir(cache): os.system(f'mkdir {cache}')
+    os.makedirs(os.path.dirname(fpath_no_ext), exist_ok=True)
 
-    fpath, fpath_str = _ext_to_fpaths(fpath_no_ext, compression=compression_level>0)
+    if codec is None:
+        candidates = [c.name for c in CODECS.values() if c.accepts is not None and c.accepts(x)]
+        candidates.append(_default_codec if compression_level > 0 else 'pickle5')
+    else:
+        candidates = [codec]
+    for i, codec in enumerate(candidates):
+        _codec = CODECS[codec]
+        fpath, fpath_str = _ext_to_fpaths(fpath_no_ext, ext=_codec.ext)
 
-    cmsg = 'compressing & ' if compression_level > 0 else ''
-    if not silent: print(f'{cmsg}caching data to [{fpath_str}]')
+        cmsg = 'compressing & ' if _codec.compressed else ''
+        if not silent: print(f'{cmsg}caching data to [{fpath_str}]')
+        # written to the side and renamed into place, so readers never see a partial file and
+        # processes that still have the old file mapped keep their (now unlinked) copy
+        tmp = _tmp_path(fpath)
+        stats = _io_stats.current = _IOStats()
+        t = time.perf_counter()
+        try:
+            _codec.dump(x, tmp, compression_level)
+            os.replace(tmp, fpath)
+            break
+        except Exception as e:
+            if os.path.isfile(tmp): os.remove(tmp)
+            if i == len(candidates)-1: raise
+            if not silent: print(f'{codec} failed with [{e}], falling back')
+        finally:
+            _io_stats.current = None
+    size = os.path.getsize(fpath)
+    _record('save', name, calls=1, bytes_written=size, **stats.phases(time.perf_counter()-t, size))
+    for c in CODECS.values(): # don't leave behind a stale copy in another format
+        other, _ = _ext_to_fpaths(fpath_no_ext, ext=c.ext)
+        if other != fpath and os.path.isfile(other): os.remove(other)
+    if _codec.describe is not None:
+        _write_meta(fpath_no_ext, _read_meta(fpath_no_ext)|_codec.describe(x))
 
-    if compression_level == 0:
-        with open(fpath, 'wb') as f:
-            pickle.dump(x, f, protocol=pickle.HIGHEST_PROTOCOL)
+def load(name: str, alt_workspace=None, silent=False, columns: list[str]|None=None, filters: list|None=None):
+    """
+    columns & filters only apply to cached DataFrames, and are pushed down to the
+    reader when stored as parquet so that only the requested subset is read
+    """
+    fpath_no_ext, cache = _get_paths(name, alt_workspace)
+
+    inflight = _get_inflight(fpath_no_ext)
+    if inflight is not None:
+        # still being written in the background, so the object is at hand
+        _record('load', name, calls=1, hits=1, memory_hits=1)
+        x, selected = inflight.x, False
     else:
-        with gzip.open(fpath, "wb", compresslevel=compression_level) as f:
-            pickle.dump(x, f, protocol=pickle.HIGHEST_PROTOCOL)
+        x, selected = _load(name, fpath_no_ext, silent, columns, filters)
+    if selected or (columns is None and filters is None): return x
+    assert isinstance(x, pd.DataFrame), f"columns & filters only apply to DataFrames, but [{name}] is {type(x)}"
+    if filters is not None: x = _apply_filters(x, filters)
+    if columns is not None: x = x[columns]
+    return x
+
+def _load(name: str, fpath_no_ext: str, silent: bool, columns: list[str]|None, filters: list|None) -> tuple[Any, bool]:
+    fpath = _find_cached(fpath_no_ext)
+    if fpath is None:
+        _record('load', name, calls=1, misses=1)
+        fpath, fpath_str = _ext_to_fpaths(fpath_no_ext)
+        raise FileNotFoundError(f"{fpath_str} doesn't exist, nor can a compressed cache be found")
+    fpath_str = _fpath_str(fpath)
 
+    codec = _detect_codec(fpath)
+    dcomp_msg = '& decompressing ' if codec.compressed else ''
+    if not silent: print(f'recovering {dcomp_msg}cached data from [{fpath_str}]')
+    _touch_access(fpath)
 
-def load(name: str, alt_workspace=None, silent=False):
+    stats = _io_stats.current = _IOStats()
+    t = time.perf_counter()
+    try:
+        if codec.partial:
+            x = codec.load(fpath, columns=columns, filters=filters)
+        else:
+            x = codec.load(fpath)
+    finally:
+        _io_stats.current = None
+    size = os.path.getsize(fpath)
+    _record('load', name, calls=1, hits=1, bytes_read=size, **stats.phases(time.perf_counter()-t, size))
+    return x, codec.partial
+
+def _touch_access(fpath: str):
+    # record the last access explicitly, since the filesystem may be mounted noatime
+    try:
+        os.utime(fpath, (time.time(), os.stat(fpath).st_mtime))
+    except OSError:
+        pass
+
+def save_bundle(name, members: dict[str, Any], alt_workspace=None, compression_level=1, silent=False, background=False):
+    """saves each member separately, so load_bundle() can read back only the ones used"""
+    save(name, members, alt_workspace, compression_level, silent, codec='bundle', background=background)
+
+def load_bundle(name: str, alt_workspace=None, silent=False) -> Bundle:
     fpath_no_ext, cache = _get_paths(name, alt_workspace)
+    _wait_inflight(fpath_no_ext) # members are only lazy once on disk
+    x = load(name, alt_workspace, silent)
+    assert isinstance(x, Bundle), f"[{name}] is not a bundle, but {type(x)}"
+    return x
+
+############################## locking ##############################
+
+def _tmp_path(fpath: str):
+    return f'{fpath}.tmp-{os.getpid()}-{uuid.uuid4().hex[:8]}'
 
-    for c in [False, True]:
-        fpath, fpath_str = _ext_to_fpaths(fpath_no_ext, compression=c)
-        if not os.path.isfile(fpath): continue
+LOCK_STALE_AFTER = 10*60.0
+class FileLock:
+    """
+    a lock file created with O_EXCL, which works across processes and nodes sharing a filesystem.
+    the holder refreshes the file's mtime in the background, and a lock that hasn't been
+    refreshed in stale_after seconds is taken to belong to a dead process and is broken
+    """
+    def __init__(self, path: str|Path, stale_after: float=LOCK_STALE_AFTER, poll: float=1.0) -> None:
+        self.path = str(path)
+        self.stale_after = stale_after
+        self.poll = poll
+        self.waited = False
+        self._heartbeat: threading.Thread|None = None
+        self._stop = threading.Event()
 
-        dcomp_msg = '& decompressing ' if c else ''
-        if not silent: print(f'recovering {dcomp_msg}cached data from [{fpath_str}]')
-        with gzip.open(fpath, "rb") if c else open(fpath, "rb") as f:
-            return pickle.load(f)
+    def _try_acquire(self):
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            f.write(f'{socket.gethostname()} {os.getpid()}\n')
+        return True
 
-    fpath, fpath_str = _ext_to_fpaths(fpath_no_ext)
-    raise FileNotFoundError(f"{fpath_str} doesn't exist, nor can a compressed cache be found")
+    def _break_if_stale(self):
+        try:
+            if time.time()-os.path.getmtime(self.path) <= self.stale_after: return
+            # renaming is atomic, so only one waiter gets the lock file, and if it was replaced
+            # by a fresh lock after the check above, that one is put back rather than removed
+            stale = _tmp_path(self.path)
+            os.rename(self.path, stale)
+        except FileNotFoundError:
+            return
+        age = time.time()-os.path.getmtime(stale)
+        if age > self.stale_after:
+            print(f'breaking stale lock [{_fpath_str(self.path)}], last refreshed {age:.0f}s ago')
+            os.remove(stale)
+        else:
+            try:
+                os.link(stale, self.path) # fails rather than overwrite, if yet another lock was taken
+            except FileExistsError:
+                pass
+            os.remove(stale)
+
+    def acquire(self, timeout: float|None=None):
+        start = time.time()
+        while not self._try_acquire():
+            if not self.waited: print(f'waiting for another process to release [{_fpath_str(self.path)}]')
+            self.waited = True
+            if timeout is not None and time.time()-start > timeout:
+                raise TimeoutError(f"couldn't acquire [{self.path}] within {timeout}s")
+            self._break_if_stale()
+            time.sleep(self.poll)
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._beat, daemon=True)
+        self._heartbeat.start()
+        return self
+
+    def _beat(self):
+        while not self._stop.wait(self.stale_after/4):
+            try:
+                os.utime(self.path)
+            except FileNotFoundError:
+                return
+
+    def release(self):
+        self._stop.set()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+############################## fingerprinting ##############################
+
+def _meta_path(fpath_no_ext: str):
+    return f'{fpath_no_ext}.meta.json'
+
+def _read_meta(fpath_no_ext: str) -> dict:
+    mpath = _meta_path(fpath_no_ext)
+    if not os.path.isfile(mpath): return {}
+    with open(mpath) as j:
+        return json.load(j)
+
+def _write_meta(fpath_no_ext: str, meta: dict):
+    mpath = _meta_path(fpath_no_ext)
+    tmp = _tmp_path(mpath)
+    with open(tmp, 'w') as j:
+        json.dump(meta, j, indent=4)
+    os.replace(tmp, mpath)
+
+def _code_fingerprint(code: CodeType, h):
+    h.update(code.co_code)
+    h.update(repr(code.co_names).encode())
+    for c in code.co_consts:
+        if isinstance(c, CodeType):
+            _code_fingerprint(c, h) # nested functions, lambdas, comprehensions
+        else:
+            _hash_arg(c, h) # not repr, frozensets (from `x in {...}`) repr in hash seed order
 
-def cache(fname, regenerate, force_regenerate=None, compression_level=1):
+def _code_names(code: CodeType):
+    yield from code.co_names
+    for c in code.co_consts:
+        if isinstance(c, CodeType): yield from _code_names(c)
+
+_unhashable_warned: set[tuple[str, str]] = set()
+def _value_fingerprint(fn: Callable, name: str, x, h, seen: set):
+    # a value fn depends on other than through its arguments: a closure variable, default or global
+    if isinstance(x, ModuleType): return
+    if callable(x) and (hasattr(x, '__code__') or hasattr(x, 'func')):
+        _fn_fingerprint(x, h, seen)
+        return
+    if isinstance(x, type):
+        h.update(f'{x.__module__}.{x.__qualname__}'.encode())
+        return
+    h.update(name.encode())
+    try:
+        _hash_arg(x, h)
+    except TypeError:
+        # only its type is tracked, so changes to it won't be noticed
+        h.update(f'unhashable:{type(x).__qualname__}'.encode())
+        k = (getattr(fn, '__qualname__', repr(fn)), name)
+        if k not in _unhashable_warned:
+            _unhashable_warned.add(k)
+            print(f"[{name}] of type {type(x).__name__}, used by [{k[0]}], can't be fingerprinted, changes to it won't trigger regeneration")
+
+def _fn_fingerprint(fn: Callable, h, seen: set|None=None):
+    if seen is None: seen = set()
+    if id(fn) in seen: return
+    seen.add(id(fn))
+    # functools.partial
+    if hasattr(fn, 'func') and hasattr(fn, 'args'):
+        _fn_fingerprint(fn.func, h, seen)
+        _hash_arg((fn.args, fn.keywords), h)
+        return
+    code = getattr(fn, '__code__', None)
+    if code is None: code = getattr(getattr(fn, '__call__', None), '__code__', None)
+    if code is None:
+        h.update(repr(fn).encode())
+        return
+    _code_fingerprint(code, h)
+    # captured state, so cache("x", lambda: parse(path)) notices a different path
+    for name, cell in zip(code.co_freevars, getattr(fn, '__closure__', None) or ()):
+        try:
+            x = cell.cell_contents
+        except ValueError: # not assigned yet
+            continue
+        _value_fingerprint(fn, name, x, h, seen)
+    _value_fingerprint(fn, '__defaults__', getattr(fn, '__defaults__', None), h, seen)
+    _value_fingerprint(fn, '__kwdefaults__', getattr(fn, '__kwdefaults__', None), h, seen)
+    # globals it reads, e.g. KOFAM_DIR, and helpers defined alongside fn, so edits to parse are noticed too.
+    # functions & classes from other modules are left out, they change with package versions, not here
+    fn_globals = getattr(fn, '__globals__', {})
+    for name in sorted(set(_code_names(code))):
+        if name not in fn_globals: continue
+        ref = fn_globals[name]
+        if callable(ref) and getattr(ref, '__module__', None) != fn.__module__: continue
+        _value_fingerprint(fn, name, ref, h, seen)
+
+def _input_fingerprint(path: Path|str, h, hash_inputs: bool):
+    path = Path(path)
+    if path.is_dir():
+        files = sorted(f for f in path.rglob('*') if f.is_file())
+    elif path.exists():
+        files = [path]
+    else:
+        h.update(f'missing:{path}'.encode())
+        return
+    for f in files:
+        h.update(str(f).encode())
+        if hash_inputs:
+            with open(f, 'rb') as fh:
+                for chunk in iter(lambda: fh.read(1<<20), b''):
+                    h.update(chunk)
+        else:
+            st = f.stat()
+            h.update(f'{st.st_size}:{st.st_mtime_ns}'.encode())
+
+def fingerprint(regenerate: Callable, args: tuple=tuple(), kwargs: dict|None=None, inputs: list[Path|str]|None=None, hash_inputs=False):
+    """
+    hash of the regenerate function's code, its arguments and the state of any input paths.
+    inputs are summarized by size & mtime, or by content if hash_inputs
+    """
+    h = hashlib.sha1()
+    _fn_fingerprint(regenerate, h)
+    _hash_arg((tuple(args), kwargs or {}), h) # stable across processes, unlike pickles of sets
+    for path in inputs or []:
+        _input_fingerprint(path, h, hash_inputs)
+    return h.hexdigest()
+
+def cache(fname, regenerate, force_regenerate=None, compression_level=1, codec: str|None=None,
+          args: tuple=tuple(), kwargs: dict|None=None, inputs: list[Path|str]|None=None, hash_inputs=False,
+          write_behind=False, lock=True, lock_timeout: float|None=None):
+    """
+    regenerate(*args, **kwargs) is only rerun if the fingerprint of its code, arguments
+    or declared inputs differs from the one recorded next to the cached data.
+    caches written before fingerprinting are adopted as is.
+    if write_behind, the result is saved in the background, see save(background=True).
+    with lock, concurrent callers in other processes wait for the first one to
+    regenerate & save, then load its result instead of regenerating it themselves
+    """
     if force_regenerate is None: force_regenerate = _force_regenerate
+    if kwargs is None: kwargs = {}
     fpath_no_ext, cache = _get_paths(fname)
-    fpath, fpath_str = _ext_to_fpaths(fpath_no_ext, compression=compression_level>0)
+    fp = fingerprint(regenerate, args, kwargs, inputs, hash_inputs)
 
-    if not force_regenerate and os.path.isfile(fpath):
+    inflight = _get_inflight(fpath_no_ext)
+    if not force_regenerate and inflight is not None and inflight.fingerprint == fp:
+        _record('cache', fname, calls=1, hits=1, memory_hits=1)
+        return inflight.x
+    _wait_inflight(fpath_no_ext)
+
+    def _up_to_date(silent=False):
+        fpath = _find_cached(fpath_no_ext)
+        if force_regenerate or fpath is None: return False
+        meta = _read_meta(fpath_no_ext)
+        if 'fingerprint' not in meta:
+            _write_meta(fpath_no_ext, meta|dict(fingerprint=fp))
+            return True
+        if meta['fingerprint'] == fp: return True
+        if not silent: print(f'fingerprint changed, regenerating [{_fpath_str(fpath)}]')
+        return False
+
+    if _up_to_date():
+        _record('cache', fname, calls=1, hits=1)
         return load(fname)
+
+    _lock = FileLock(f'{fpath_no_ext}.lock') if lock else None
+    if _lock is not None:
+        os.makedirs(os.path.dirname(fpath_no_ext), exist_ok=True)
+        _lock.acquire(lock_timeout)
+    try:
+        # someone else may have made it between our check & taking the lock, waited or not
+        if _lock is not None and _up_to_date(silent=True): # already said so above, if changed
+            _lock.release()
+            _record('cache', fname, calls=1, hits=1)
+            return load(fname)
+
+        t = time.perf_counter()
+        x = regenerate(*args, **kwargs)
+        _record('cache', fname, calls=1, misses=1, seconds_regenerate=time.perf_counter()-t)
+    except BaseException:
+        if _lock is not None: _lock.release()
+        raise
+
+    def _write():
+        try:
+            _save(fname, x, None, compression_level, write_behind, codec)
+            _write_meta(fpath_no_ext, _read_meta(fpath_no_ext)|dict(fingerprint=fp))
+        finally:
+            if _lock is not None: _lock.release()
+    if write_behind:
+        print(f'caching data in the background to [{_fpath_str(fpath_no_ext)}]')
+        _write_behind(fpath_no_ext, x, _write, fp)
     else:
-        x = regenerate()
-        save(fname, x, compression_level=compression_level)
-        return x
+        _write()
+    return x
+
+############################## partitioned caches ##############################
+
+class PartitionedCache:
+    """
+    a cache built from many independent inputs, like one kofam .out file or assembly stats JSON per sample.
+    every key gets its own partition, built by build(key, inputs), and a manifest records the fingerprint
+    of each, so that update() only rebuilds partitions whose inputs (or build code) changed
+    """
+    MANIFEST = 'manifest.json'
+    def __init__(self, name: str, build: Callable[[str, Any], Any], alt_workspace=None, hash_inputs=False,
+                 compression_level=1, codec: str|None=None) -> None:
+        self.name = name
+        self.build = build
+        self.alt_workspace = alt_workspace
+        self.hash_inputs = hash_inputs
+        self.compression_level = compression_level
+        self.codec = codec
+        fpath_no_ext, _ = _get_paths(name, alt_workspace)
+        self._manifest_path = os.path.join(fpath_no_ext, self.MANIFEST)
+        self.manifest: dict[str, dict] = {}
+        if os.path.isfile(self._manifest_path):
+            with open(self._manifest_path) as j:
+                self.manifest = json.load(j)
+
+    def _partition_name(self, key: str):
+        return f'{self.name}/part-{hashlib.sha1(key.encode()).hexdigest()[:16]}'
+
+    def _write_manifest(self):
+        os.makedirs(os.path.dirname(self._manifest_path), exist_ok=True)
+        tmp = f'{self._manifest_path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as j:
+            json.dump(self.manifest, j, indent=4)
+        os.replace(tmp, self._manifest_path)
+
+    def update(self, inputs: dict[str, Path|str|list[Path|str]], silent=False) -> list[str]:
+        """
+        brings the partitions in line with inputs, {key: path or list of paths}.
+        partitions of keys no longer in inputs are dropped. returns the keys that were (re)built
+        """
+        rebuilt = []
+        for i, (key, paths) in enumerate(inputs.items()):
+            paths = paths if isinstance(paths, list) else [paths]
+            fp = fingerprint(self.build, (key,), None, paths, self.hash_inputs)
+            entry = self.manifest.get(key)
+            if entry is not None and entry['fingerprint'] == fp and save_exists(entry['partition'], self.alt_workspace): continue
+            if not silent: print(f'{i+1} of {len(inputs)} | building partition [{key}]', end='\r')
+            pname = self._partition_name(key)
+            save(pname, self.build(key, paths if len(paths) > 1 else paths[0]), self.alt_workspace, self.compression_level, silent=True, codec=self.codec)
+            self.manifest[key] = dict(fingerprint=fp, partition=pname)
+            self._write_manifest() # after every partition, so an interrupted update keeps its progress
+            rebuilt.append(key)
+        if not silent and len(rebuilt) > 0: print()
+
+        for key in [k for k in self.manifest if k not in inputs]:
+            fpath_no_ext, _ = _get_paths(self.manifest.pop(key)['partition'], self.alt_workspace)
+            for c in CODECS.values():
+                fpath, _ = _ext_to_fpaths(fpath_no_ext, ext=c.ext)
+                if os.path.isfile(fpath): os.remove(fpath)
+            self._write_manifest()
+        return rebuilt
+
+    def keys(self):
+        return list(self.manifest)
+
+    def __len__(self):
+        return len(self.manifest)
+
+    def __contains__(self, key: str):
+        return key in self.manifest
+
+    def __getitem__(self, key: str):
+        return load(self.manifest[key]['partition'], self.alt_workspace, silent=True)
+
+    def items(self):
+        """(key, partition) pairs, each partition only loaded once it is reached"""
+        for key in self.manifest:
+            yield key, self[key]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def load(self, columns: list[str]|None=None, filters: list|None=None) -> pd.DataFrame:
+        """the DataFrame partitions concatenated, reading one partition at a time"""
+        if len(self.manifest) == 0: return pd.DataFrame(columns=columns)
+        parts = (load(e['partition'], self.alt_workspace, silent=True, columns=columns, filters=filters) for e in self.manifest.values())
+        return pd.concat(parts, ignore_index=True)
+
+def cache_partitioned(name: str, inputs: dict[str, Path|str|list[Path|str]], build: Callable[[str, Any], Any], **kwargs) -> PartitionedCache:
+    """PartitionedCache(name, build, **kwargs), updated with inputs"""
+    pc = PartitionedCache(name, build, **kwargs)
+    pc.update(inputs)
+    return pc
 
 ############################## fn decorator ##############################
 
 T = TypeVar('T')
-def cache_fn_result(loader: Callable[..., T]) -> Callable[[], T]:
-    data = None
-    def getter(*args, **kargs):
-        nonlocal data
-        if data is None:
-            data = loader(*args, **kargs)
-        return data
-    return getter
+def cache_fn_result(loader: Callable[..., T]) -> Callable[..., T]:
+    """unbounded memoize(), so results are kept per distinct set of arguments"""
+    return memoize(maxsize=None)(loader)
+
+def _hash_arg(x, h):
+    if isinstance(x, np.ndarray) and not x.dtype.hasobject:
+        h.update(f'ndarray:{x.dtype}:{x.shape}'.encode())
+        h.update(np.ascontiguousarray(x).data)
+    elif isinstance(x, (pd.DataFrame, pd.Series)):
+        h.update(f'{type(x).__name__}:{x.shape}'.encode())
+        h.update(repr(list(x.columns) if isinstance(x, pd.DataFrame) else x.name).encode())
+        h.update(repr(list(x.dtypes) if isinstance(x, pd.DataFrame) else x.dtype).encode())
+        h.update(pd.util.hash_pandas_object(x, index=True).values.data)
+    elif isinstance(x, (list, tuple)):
+        h.update(f'{type(x).__name__}:{len(x)}'.encode())
+        for v in x: _hash_arg(v, h)
+    elif isinstance(x, (dict, set, frozenset)):
+        # order independent, each item is hashed on its own and the digests are sorted
+        items = x.items() if isinstance(x, dict) else x
+        digests = []
+        for item in items:
+            _h = hashlib.sha1()
+            _hash_arg(item, _h)
+            digests.append(_h.digest())
+        h.update(f'{type(x).__name__}:{len(x)}'.encode())
+        for d in sorted(digests): h.update(d)
+    elif x is None or isinstance(x, (str, bytes, int, float, bool, Path)):
+        h.update(f'{type(x).__name__}:{x!r}'.encode())
+    else:
+        try:
+            h.update(pickle.dumps(x, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception as e:
+            raise TypeError(f"can't memoize on an argument of type {type(x)}") from e
+
+def _approx_size(x) -> int:
+    if isinstance(x, np.ndarray): return x.nbytes
+    if isinstance(x, (pd.DataFrame, pd.Series)): return int(x.memory_usage(deep=False).sum())
+    if isinstance(x, (list, tuple, set, frozenset)): return sys.getsizeof(x)+sum(_approx_size(v) for v in x)
+    if isinstance(x, dict): return sys.getsizeof(x)+sum(_approx_size(k)+_approx_size(v) for k, v in x.items())
+    if hasattr(x, '__dict__'): return sys.getsizeof(x)+_approx_size(vars(x))
+    return sys.getsizeof(x)
+
+def memoize(maxsize: int|None=128, maxbytes: int|None=None, spill=False, alt_workspace=None):
+    """
+    memoizes on the normalized arguments (defaults applied, arrays & DataFrames hashed by content),
+    keeping at most maxsize entries and, if given, maxbytes (approximately) in memory.
+    with spill, evicted entries are written to the on-disk cache under memo/ and recovered from there.
+    results are shared between calls, so treat them as read-only.
+    the wrapper has cache_info() and cache_clear()
+    """
+    def decorator(fn: Callable[..., T]) -> Callable[..., T]:
+        name = getattr(fn, '__qualname__', repr(fn))
+        sig = inspect.signature(fn)
+        entries: OrderedDict[str, tuple[Any, int]] = OrderedDict()
+        stats = dict(hits=0, misses=0, spill_hits=0, evictions=0)
+        total = 0
+        lock = threading.RLock()
+
+        def _key(args, kwargs):
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            h = hashlib.sha1()
+            _hash_arg(tuple(bound.arguments.items()), h)
+            return h.hexdigest()
+
+        code_fp = fingerprint(fn)[:16] if spill else ''
+        def _spill_name(key: str):
+            # spilled entries outlive the process, so they're kept per version of fn's code
+            return f'memo/{fn.__module__}.{name}/{code_fp}/{key}'.replace('<', '').replace('>', '')
+
+        def _put(key: str, value):
+            nonlocal total
+            size = _approx_size(value) if maxbytes is not None else 0
+            entries[key] = (value, size)
+            total += size
+            while len(entries) > 0 and ((maxsize is not None and len(entries) > maxsize) or (maxbytes is not None and total > maxbytes)):
+                k, (v, _size) = entries.popitem(last=False)
+                total -= _size
+                stats['evictions'] += 1
+                if spill: save(_spill_name(k), v, alt_workspace=alt_workspace, silent=True, background=True)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = _key(args, kwargs)
+            with lock:
+                if key in entries:
+                    entries.move_to_end(key)
+                    stats['hits'] += 1
+                    _record('memoize', name, calls=1, hits=1)
+                    return entries[key][0]
+                if spill and save_exists(_spill_name(key), alt_workspace):
+                    value = load(_spill_name(key), alt_workspace, silent=True)
+                    stats['spill_hits'] += 1
+                    _record('memoize', name, calls=1, hits=1, spill_hits=1)
+                    _put(key, value)
+                    return value
+            t = time.perf_counter()
+            value = fn(*args, **kwargs)
+            with lock:
+                stats['misses'] += 1
+                _record('memoize', name, calls=1, misses=1, seconds_total=time.perf_counter()-t)
+                _put(key, value)
+            return value
+
+        def cache_info():
+            with lock:
+                return stats|dict(entries=len(entries), bytes=total, maxsize=maxsize, maxbytes=maxbytes)
+
+        def cache_clear():
+            nonlocal total
+            with lock:
+                entries.clear()
+                total = 0
+
+        setattr(wrapper, 'cache_info', cache_info)
+        setattr(wrapper, 'cache_clear', cache_clear)
+        return wrapper
+    return decorator
 
 # #####################################################################################
 
+class _MemoryTier:
+    """
+    decoded values held in memory, bounded by an approximate byte budget
+    (the size of each value's JSON encoding). eviction is "lru" or "fifo"
+    """
+    POLICIES = {"lru", "fifo"}
+    def __init__(self, budget: int, eviction: str="lru") -> None:
+        assert eviction in self.POLICIES, f"eviction must be one of {self.POLICIES}"
+        self.budget = budget
+        self.eviction = eviction
+        self.entries: OrderedDict[str, tuple[dict, int]] = OrderedDict()
+        self.size = 0
+        self.hits, self.misses, self.evictions = 0, 0, 0
+        self.lock = threading.Lock()
+
+    def get(self, key: str):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if self.eviction == "lru": self.entries.move_to_end(key)
+            return entry[0]
+
+    def configure(self, budget: int, eviction: str):
+        assert eviction in self.POLICIES, f"eviction must be one of {self.POLICIES}"
+        with self.lock:
+            self.budget, self.eviction = budget, eviction
+            self._evict()
+
+    def put(self, key: str, value: dict, size: int):
+        with self.lock:
+            self._discard(key)
+            if size > self.budget: return
+            self.entries[key] = (value, size)
+            self.size += size
+            self._evict()
+
+    def _evict(self):
+        while self.size > self.budget:
+            _, (_, _size) = self.entries.popitem(last=False)
+            self.size -= _size
+            self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _discard(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None: self.size -= entry[1]
+
+    def discard(self, key: str):
+        with self.lock:
+            self._discard(key)
+
+    def stats(self):
+        with self.lock:
+            return dict(hits=self.hits, misses=self.misses, evictions=self.evictions, entries=len(self.entries), bytes=self.size, budget=self.budget)
+
+def _connect(path: Path, busy_timeout: float, **kwargs):
+    # WAL lets readers in other threads & processes proceed while a write is in progress,
+    # NORMAL sync avoids an fsync per commit, and busy_timeout waits out other writers' locks
+    conn = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False, **kwargs)
+    conn.execute(f"PRAGMA busy_timeout={int(busy_timeout*1000)}")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+class _Writer:
+    """
+    the single writer for a database file within this process. upserts from all threads are
+    queued and whatever has accumulated is committed together in one transaction (group commit).
+    rows are visible through pending until they are committed. read times are only collected
+    in touched, and written with the next commit of rows, once TOUCH_BATCH keys have been read,
+    or on flush(touches=True), so that reading alone doesn't take the write lock
+    """
+    RETRIES = 10
+    TOUCH_BATCH = 1024
+    def __init__(self, path: Path, busy_timeout: float) -> None:
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.queue: queue.Queue[list[tuple[str, bytes]]] = queue.Queue()
+        self.pending: dict[str, bytes] = {}
+        self.touched: dict[str, float] = {}
+        self.lock = threading.Lock()
+        self.error: BaseException|None = None
+        self.thread = threading.Thread(target=self._run, name=f"DictCache writer [{path.name}]", daemon=True)
+        self.thread.start()
+
+    def put(self, rows: list[tuple[str, bytes]]):
+        with self.lock:
+            for k, blob in rows: self.pending[k] = blob
+        self.queue.put(rows)
+
+    def get_pending(self, key: str):
+        with self.lock:
+            return self.pending.get(key)
+
+    def touch(self, keys: Iterable[str]):
+        now = time.time()
+        with self.lock:
+            for k in keys: self.touched[k] = now
+            full = len(self.touched) >= self.TOUCH_BATCH
+        if full: self.queue.put([])
+
+    def flush(self, touches=False):
+        if touches:
+            with self.lock:
+                touched = len(self.touched) > 0
+            if touched: self.queue.put([])
+        self.queue.join()
+        if self.error is not None:
+            e, self.error = self.error, None
+            raise e
+
+    def _run(self):
+        conn = _connect(self.path, self.busy_timeout, isolation_level=None)
+        while True:
+            batches = [self.queue.get()]
+            while True:
+                try:
+                    batches.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            rows = [r for b in batches for r in b]
+            with self.lock:
+                touched, self.touched = self.touched, {}
+            try:
+                if len(rows) > 0 or len(touched) > 0: self._commit(conn, rows, touched)
+            except BaseException as e:
+                self.error = e
+            with self.lock:
+                for k, blob in rows:
+                    if self.pending.get(k) is blob: del self.pending[k]
+            for _ in batches: self.queue.task_done()
+
+    def _commit(self, conn: sqlite3.Connection, rows: list[tuple[str, bytes]], touched: dict[str, float]):
+        for attempt in range(self.RETRIES):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+            except sqlite3.OperationalError as e:
+                # busy_timeout already waited, back off a little more for long writers in other processes
+                if "locked" not in str(e) or attempt == self.RETRIES-1: raise
+                time.sleep(0.1 * 2**attempt)
+                continue
+            try:
+                now = time.time()
+                conn.executemany("INSERT OR REPLACE INTO json_cache (id, data, created, last_access) VALUES (?, ?, ?, ?)", [(k, blob, now, now) for k, blob in rows])
+                conn.executemany("UPDATE json_cache SET last_access=? WHERE id=?", [(t, k) for k, t in touched.items()])
+                conn.execute("COMMIT")
+                return
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+_writers: dict[tuple[int, Path], _Writer] = {}
+_writers_lock = threading.Lock()
+def _get_writer(path: Path, busy_timeout: float):
+    k = (os.getpid(), path) # threads don't survive a fork, so each process gets its own
+    with _writers_lock:
+        if k not in _writers: _writers[k] = _Writer(path, busy_timeout)
+        return _writers[k]
+
+@atexit.register
+def _flush_writers():
+    for (pid, _), w in list(_writers.items()):
+        if pid == os.getpid(): w.flush(touches=True)
+
+def _db_bytes(path: Path):
+    # committed rows may only be in the write-ahead log until it is checkpointed
+    wal = Path(f"{path}-wal")
+    return os.path.getsize(path) + (os.path.getsize(wal) if wal.exists() else 0)
+
+def _decompress_blob(blob: bytes, decompressor: Callable[[int], Any]) -> bytes:
+    # rows written before a dictionary was trained are still gzip,
+    # zstd frames name the dictionary they were compressed with
+    if blob[:2] == b'\x1f\x8b': return gzip.decompress(blob)
+    import zstandard
+    return decompressor(zstandard.get_frame_parameters(blob).dict_id).decompress(blob)
+
+def _zstd_decompressors(zdicts: dict[int, bytes]):
+    import zstandard
+    return {i: zstandard.ZstdDecompressor(dict_data=zstandard.ZstdCompressionDict(z)) for i, z in zdicts.items()}
+
+# state for DictCache.scan() workers, set once per process by the pool initializer
+_scan_state: dict[str, Any] = {}
+def _scan_init(zdicts: dict[int, bytes], fn: Callable|None):
+    ds = _zstd_decompressors(zdicts) if len(zdicts) > 0 else {}
+    _scan_state.update(d=ds.__getitem__, fn=fn)
+
+def _scan_decode(rows: list[tuple[str, bytes]]):
+    d, fn = _scan_state['d'], _scan_state['fn']
+    decoded = []
+    for k, blob in rows:
+        v = json.loads(_decompress_blob(blob, d).decode('utf-8'))
+        decoded.append((k, fn(v) if fn is not None else v))
+    return decoded, sum(len(b) for _, b in rows)
+
 class DictCache:
+    """
+    safe to share between threads, and to open from several processes at once.
+    each thread reads through its own connection and writes go through a
+    single queue per database file, see _Writer
+    """
     EXT = ".db"
-    def __init__(self, name: str, save_folder: Path|None=None, compression: int=9) -> None:
+    BUSY_TIMEOUT = 60.0
+    PAGE_SIZE = 16384
+    _memory_tiers: dict[Path, _MemoryTier] = {} # shared by all instances opened on the same file
+    def __init__(self, name: str, save_folder: Path|None=None, compression: int=9, memory_budget: int=0, eviction: str="lru") -> None:
+        """
+        memory_budget > 0 keeps up to that many bytes of decoded values in memory, in front of
+        the database. values returned from memory are shared, so treat them as read-only
+        """
         if save_folder is None:
             save_folder = WORKSPACE_ROOT.joinpath(f"data/cache")
             if not save_folder.exists(): os.makedirs(save_folder, exist_ok=True)
         if not name.endswith(self.EXT): name += self.EXT
+        self.path = save_folder.joinpath(name).resolve()
+        self._local = threading.local()
+        self._conns: list[sqlite3.Connection] = []
+        self._conns_lock = threading.Lock()
         # Connect to the SQLite database (or create it if it doesn't exist)
-        self.conn = sqlite3.connect(save_folder.joinpath(name))
-
-        # Create a table to store the compressed, cached JSON data
-        self.conn.execute('''CREATE TABLE IF NOT EXISTS json_cache
-                        (id TEXT PRIMARY KEY, data BLOB)''')
+        # page size only takes effect for new databases, so it's set before the tables are
+        # created & before _connect() switches to WAL, after which it can't change
+        conn = sqlite3.connect(self.path, timeout=self.BUSY_TIMEOUT, isolation_level=None)
+        conn.execute(f"PRAGMA page_size={self.PAGE_SIZE}")
+        # one transaction holding the write lock, so processes opening the same file at once
+        # don't race each other between reading the columns & adding them
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Create a table to store the compressed, cached JSON data, with write times for
+            # expiring old rows and read times for evicting the least recently used
+            conn.execute('''CREATE TABLE IF NOT EXISTS json_cache
+                            (id TEXT PRIMARY KEY, data BLOB, created REAL, last_access REAL)''')
+            # and one for settings that apply to the whole cache, like a shared compression dictionary
+            conn.execute('''CREATE TABLE IF NOT EXISTS cache_meta
+                            (key TEXT PRIMARY KEY, value BLOB)''')
+            # databases from before these columns existed. their rows count as new & unread
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(json_cache)")}
+            if "created" not in columns:
+                conn.execute("ALTER TABLE json_cache ADD COLUMN created REAL")
+                conn.execute("UPDATE json_cache SET created=?", (time.time(),))
+            if "last_access" not in columns:
+                conn.execute("ALTER TABLE json_cache ADD COLUMN last_access REAL")
+                conn.execute("UPDATE json_cache SET last_access=created")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
         
         self.compression = compression
+        self._zstd = threading.local() # zstandard (de)compressors aren't thread safe
+        self.zstd_dict: bytes|None = None
+        self._reload_dictionary()
+
+        self._writer = _get_writer(self.path, self.BUSY_TIMEOUT)
+
+        self.memory: _MemoryTier|None = None
+        if memory_budget > 0:
+            tier = self._memory_tiers.get(self.path)
+            if tier is None:
+                tier = _MemoryTier(memory_budget, eviction)
+                self._memory_tiers[self.path] = tier
+            tier.configure(memory_budget, eviction)
+            self.memory = tier
+
+    def memory_stats(self) -> dict:
+        return self.memory.stats() if self.memory is not None else {}
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # one connection per thread (and per process, in case of a fork)
+        conn, pid = getattr(self._local, "conn", (None, None))
+        if conn is None or pid != os.getpid():
+            conn = _connect(self.path, self.BUSY_TIMEOUT)
+            self._local.conn = conn, os.getpid()
+            with self._conns_lock: self._conns.append(conn)
+        return conn
 
     def save(self):
-        # Commit the changes to the database
-        self.conn.commit()
+        # Wait for queued writes to be committed to the database
+        self._writer.flush()
 
     def close(self):
-        self.conn.commit()
-        self.conn.close()
+        self.save()
+        with self._conns_lock:
+            for conn in self._conns:
+                conn.close()
+            self._conns.clear()
+        self._local = threading.local()
 
     def __enter__(self):
         return self
@@ -126,6 +1375,7 @@ class DictCache:
         self.close()
 
     def _get_iterator(self, fields: str):
+        self.save() # so that scans include queued writes
         return self.conn.execute(f"SELECT {fields} FROM json_cache")
 
     def keys(self):
@@ -141,45 +1391,398 @@ class DictCache:
     def __iter__(self):
         return self.keys()
 
+    def scan(self, fn: Callable[[dict], Any]|None=None, workers: int|None=None, chunk: int=1024, ordered: bool=True):
+        """
+        yields (key, fn(value)), or (key, value) without fn, for every row, like items().
+        rows are read in chunks of raw blobs and decoded (and passed through fn) in a process
+        pool, so fn must be picklable, e.g. a module level function. if not ordered, chunks
+        are yielded as they finish rather than in rowid order. errors in fn are raised as BatchError
+        """
+        if workers is None: workers = os.cpu_count() or 1
+        self.save()
+        zdicts = self._dictionaries() # as of now
+        def _rows():
+            # a page at a time, rather than holding one read cursor open for the whole scan
+            last = -1
+            while True:
+                rows = self.conn.execute("SELECT rowid, id, data FROM json_cache WHERE rowid > ? ORDER BY rowid LIMIT ?", (last, chunk)).fetchall()
+                if len(rows) == 0: return
+                last = rows[-1][0]
+                yield from ((k, v) for _, k, v in rows)
+
+        t = time.perf_counter()
+        n, read = 0, 0
+        results = imap_batches(_rows(), chunk, _scan_decode, workers=workers, ordered=ordered, initializer=_scan_init, initargs=(zdicts, fn))
+        for decoded, _read in results:
+            n, read = n+len(decoded), read+_read
+            yield from decoded
+        _record('DictCache.scan', self.path.stem, calls=1, rows=n, bytes_read=read, seconds_total=time.perf_counter()-t)
+
     def __contains__(self, key: str):
-        return self.get(key) is not None
+        if self._writer.get_pending(key) is not None: return True
+        # answered from the primary key index, without touching the value
+        return self.conn.execute("SELECT 1 FROM json_cache WHERE id=? LIMIT 1", (key,)).fetchone() is not None
+
+    def _select_in(self, fields: str, keys: Iterable[str], chunk: int):
+        self.save()
+        for batch in batchify(keys, chunk):
+            q = ", ".join("?"*len(batch))
+            yield from self.conn.execute(f"SELECT {fields} FROM json_cache WHERE id IN ({q})", list(batch))
+
+    def contains_many(self, keys: Iterable[str], chunk: int=900) -> set[str]:
+        """the subset of keys that are cached"""
+        return {row[0] for row in self._select_in("id", keys, chunk)}
+
+    def get_many(self, keys: Iterable[str], chunk: int=900):
+        """
+        yields (key, value) for the cached subset of keys, in no particular order.
+        keys are looked up in batches and each value is only decompressed as it is yielded
+        """
+        for k, v in self._select_in("id, data", keys, chunk):
+            self._writer.touch([k])
+            yield k, self._decompress(v)
+
+    def _encode(self, data: dict) -> bytes:
+        return json.dumps(data).encode('utf-8')
+
+    def _reload_dictionary(self):
+        # another instance or process may have trained (or retrained) one since we opened
+        row = self.conn.execute("SELECT value FROM cache_meta WHERE key='zstd_dict'").fetchone()
+        self.zstd_dict = row[0] if row is not None else None
+
+    def _dictionaries(self) -> dict[int, bytes]:
+        """every dictionary rows may have been compressed with, by dictionary id"""
+        rows = self.conn.execute("SELECT value FROM cache_meta WHERE key LIKE 'zstd_dict%'").fetchall()
+        if len(rows) == 0: return {}
+        import zstandard
+        return {zstandard.ZstdCompressionDict(v).dict_id(): v for v, in rows}
 
-    # Define a function to cache JSON data (compressed with gzip)
+    def _decompressor(self, dict_id: int):
+        ds = getattr(self._zstd, "ds", None)
+        if ds is None: ds = self._zstd.ds = {}
+        if dict_id not in ds:
+            # a dictionary this instance hasn't seen, trained since it was opened
+            ds.update(_zstd_decompressors(self._dictionaries()))
+            self._reload_dictionary()
+            if dict_id not in ds: raise KeyError(f"zstd dictionary [{dict_id}] not found in [{self.path.name}]")
+        return ds[dict_id]
+
+    _NOT_BUILT = object()
+    def _zstd_compressor(self):
+        import zstandard
+        if getattr(self._zstd, "dict", self._NOT_BUILT) is not self.zstd_dict:
+            zdict = zstandard.ZstdCompressionDict(self.zstd_dict) if self.zstd_dict is not None else None
+            self._zstd.c = zstandard.ZstdCompressor(level=min(self.compression, 19), dict_data=zdict)
+            self._zstd.dict = self.zstd_dict
+        return self._zstd.c
+
+    def _compress_raw(self, encoded: bytes) -> bytes:
+        # gzip, unless a shared dictionary has been trained for this cache
+        if self.zstd_dict is None:
+            return gzip.compress(encoded, compresslevel=self.compression)
+        return self._zstd_compressor().compress(encoded)
+
+    def _compress(self, data: dict) -> bytes:
+        # Serialize the JSON data to a string & compress it
+        return self._compress_raw(self._encode(data))
+
+    # Define a function to cache compressed JSON data
     def __setitem__(self, key: str, data: dict):
-        # Serialize the JSON data to a string
-        json_data = json.dumps(data)
+        t0 = time.perf_counter()
+        encoded = self._encode(data)
+        t1 = time.perf_counter()
+        compressed_data = self._compress_raw(encoded)
+        _record('DictCache.set', self.path.stem, calls=1, bytes_written=len(compressed_data), raw_bytes=len(encoded),
+                seconds_serialize=t1-t0, seconds_compress=time.perf_counter()-t1)
         
-        # Compress the JSON data using gzip
-        gzip_buffer = BytesIO()
-        with gzip.GzipFile(mode='wb', fileobj=gzip_buffer, compresslevel=self.compression) as f:
-            f.write(json_data.encode('utf-8'))
-        compressed_data = gzip_buffer.getvalue()
-        
-        # Insert or replace the compressed data in the database
-        self.conn.execute("INSERT OR REPLACE INTO json_cache (id, data) VALUES (?, ?)", (key, compressed_data))
+        # Queue the compressed data to be inserted or replaced in the database
+        self._writer.put([(key, compressed_data)])
+        if self.memory is not None: self.memory.put(key, data, len(encoded)) # write-through
+
+    def set_many(self, items: Iterable[tuple[str, dict]], workers: int|None=None, chunk: int=4096):
+        """
+        values are compressed on a thread pool (zlib releases the GIL) and each chunk is
+        queued for the writer as one executemany
+        """
+        if workers is None: workers = os.cpu_count() or 1
+        compress_all = lambda values: [(len(e), self._compress_raw(e)) for e in map(self._encode, values)]
+        t = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for batch in batchify(items, chunk):
+                batch = list(batch)
+                keys = [k for k, _ in batch]
+                # one task per worker rather than per value, to keep dispatch overhead out of the way
+                step = -(-len(batch) // workers)
+                blobs = pool.map(compress_all, [[v for _, v in batch[i:i+step]] for i in range(0, len(batch), step)])
+                sizes, blobs = zip(*[b for g in blobs for b in g])
+                _record('DictCache.set', self.path.stem, calls=len(blobs), bytes_written=sum(len(b) for b in blobs), raw_bytes=sum(sizes))
+                self._writer.put(list(zip(keys, blobs)))
+                # bulk loads invalidate rather than populate, so they don't flush out the hot set
+                if self.memory is not None:
+                    for k in keys: self.memory.discard(k)
+        self.save()
+        _record('DictCache.set', self.path.stem, seconds_total=time.perf_counter()-t)
+
+    def update(self, mapping: dict[str, dict]):
+        self.set_many(mapping.items())
+
+    def _decompress_raw(self, compressed_data) -> bytes:
+        return _decompress_blob(compressed_data, self._decompressor)
 
     def _decompress(self, compressed_data):
-        gzip_buffer = BytesIO(compressed_data)
-        with gzip.GzipFile(mode='rb', fileobj=gzip_buffer) as f:
-            return json.loads(f.read().decode('utf-8'))
+        return json.loads(self._decompress_raw(compressed_data).decode('utf-8'))
 
     def get(self, key: str, default: dict|None=None) -> dict|None:
-        # Query the database for the compressed JSON data
-        cursor = self.conn.execute("SELECT data FROM json_cache WHERE id=?", (key,))
-        
-        # Get the first row of the result (or None if no rows are returned)
-        row = cursor.fetchone()
+        if self.memory is not None:
+            v = self.memory.get(key)
+            if v is not None:
+                _record('DictCache.get', self.path.stem, calls=1, hits=1, memory_hits=1)
+                self._writer.touch([key])
+                return v
+
+        pending = self._writer.get_pending(key)
+        if pending is not None:
+            row = (pending,)
+        else:
+            # Query the database for the compressed JSON data
+            cursor = self.conn.execute("SELECT data FROM json_cache WHERE id=?", (key,))
+            
+            # Get the first row of the result (or None if no rows are returned)
+            row = cursor.fetchone()
         
         if row is not None:
             # Decompress the compressed JSON data
-            compressed_data = row[0]
+            t0 = time.perf_counter()
+            raw = self._decompress_raw(row[0])
+            t1 = time.perf_counter()
             # Deserialize the JSON data and return it
-            return self._decompress(compressed_data)
+            v = json.loads(raw.decode('utf-8'))
+            _record('DictCache.get', self.path.stem, calls=1, hits=1, bytes_read=len(row[0]), raw_bytes=len(raw),
+                    seconds_compress=t1-t0, seconds_serialize=time.perf_counter()-t1)
+            if self.memory is not None: self.memory.put(key, v, len(raw))
+            self._writer.touch([key])
+            return v
         else:
+            _record('DictCache.get', self.path.stem, calls=1, misses=1)
             return default
 
+    def train_dictionary(self, samples: int=4096, size: int=112640):
+        """
+        trains a zstd dictionary on a random sample of cached values and stores it in the
+        database. from then on, all new values are compressed with it. see recompress()
+        """
+        import zstandard
+        self.save()
+        rows = self.conn.execute("SELECT data FROM json_cache ORDER BY RANDOM() LIMIT ?", (samples,))
+        sample = [self._decompress_raw(r[0]) for r in rows]
+        assert len(sample) > 0, "nothing to train on"
+        zdict = zstandard.train_dictionary(size, sample)
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO cache_meta (key, value) VALUES ('zstd_dict', ?)", (zdict.as_bytes(),))
+            # older dictionaries are kept, for rows not yet recompressed & instances still writing with them
+            self.conn.execute("INSERT OR REPLACE INTO cache_meta (key, value) VALUES (?, ?)", (f'zstd_dict:{zdict.dict_id()}', zdict.as_bytes()))
+        self.zstd_dict = zdict.as_bytes()
+
+    def recompress(self, chunk: int=4096, vacuum: bool=True):
+        """rewrites every value with the current compression, e.g. after train_dictionary()"""
+        self.save()
+        last = -1
+        while True:
+            rows = self.conn.execute("SELECT rowid, data FROM json_cache WHERE rowid > ? ORDER BY rowid LIMIT ?", (last, chunk)).fetchall()
+            if len(rows) == 0: break
+            last = rows[-1][0]
+            with self.conn:
+                self.conn.executemany("UPDATE json_cache SET data=? WHERE rowid=?", [
+                    (self._compress_raw(self._decompress_raw(v)), rowid) for rowid, v in rows
+                ])
+        if vacuum: self.vacuum()
+
+    def evict(self, ttl: float|None=None, max_bytes: int|None=None, vacuum: bool=True) -> int:
+        """
+        removes rows written more than ttl seconds ago, then the least recently read (or
+        written) rows until the values add up to at most max_bytes. reads through get() and
+        get_many() count, scans & iteration don't. returns the number of rows removed
+        """
+        self._writer.flush(touches=True) # so that the latest reads count
+        removed = 0
+        with self.conn:
+            if ttl is not None:
+                removed += self.conn.execute("DELETE FROM json_cache WHERE created < ?", (time.time()-ttl,)).rowcount
+            if max_bytes is not None:
+                total = self.conn.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM json_cache").fetchone()[0]
+                to_remove = []
+                for rowid, size in self.conn.execute("SELECT rowid, LENGTH(data) FROM json_cache ORDER BY COALESCE(last_access, created), rowid"):
+                    if total <= max_bytes: break
+                    to_remove.append((rowid,))
+                    total -= size
+                self.conn.executemany("DELETE FROM json_cache WHERE rowid=?", to_remove)
+                removed += len(to_remove)
+        if self.memory is not None: self.memory.clear()
+        if vacuum and removed > 0: self.vacuum()
+        return removed
+
+    def vacuum(self):
+        self.save()
+        self.conn.execute("VACUUM")
+        # in WAL mode the file only shrinks once the vacuumed pages are checkpointed back
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def report(self) -> dict:
+        self.save()
+        rows, value_bytes, oldest, newest = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0), MIN(created), MAX(created) FROM json_cache"
+        ).fetchone()
+        return dict(
+            name=self.path.name, bytes=_db_bytes(self.path), rows=rows, value_bytes=value_bytes,
+            oldest=oldest, newest=newest, dictionary=self.zstd_dict is not None,
+        )
+
     # Define a function to retrieve cached JSON data
     def __getitem__(self, key: str) -> dict:
         v = self.get(key)
         if v is None: raise KeyError(f"[{key}] not found")
         return v
+
+
+# #####################################################################################
+# cache management
+
+def _entry_name(cache: str, fpath: str):
+    rel = os.path.relpath(fpath, cache)
+    for ext in sorted({'.meta.json'}|{c.ext for c in CODECS.values()}, key=len, reverse=True):
+        if rel.endswith(ext): return rel[:-len(ext)]
+    return None
+
+def _cache_entries(alt_workspace=None) -> pd.DataFrame:
+    _, cache = _get_paths('', alt_workspace)
+    entries: dict[str, dict] = {}
+    def _add(name: str, fpath: str):
+        st = os.stat(fpath)
+        e = entries.setdefault(name, dict(name=name, bytes=0, created=0.0, last_access=0.0, files=[]))
+        e['bytes'] += st.st_size
+        e['files'].append(fpath)
+        if fpath.endswith('.meta.json'): return
+        e['created'] = max(e['created'], st.st_mtime)
+        e['last_access'] = max(e['last_access'], st.st_atime, st.st_mtime)
+
+    for dirpath, dirs, files in os.walk(cache):
+        if PartitionedCache.MANIFEST in files:
+            # a PartitionedCache is one entry, so partitions its manifest lists aren't evicted on their own
+            dirs[:] = []
+            for d, _, fs in os.walk(dirpath):
+                for f in fs: _add(os.path.relpath(dirpath, cache), os.path.join(d, f))
+            continue
+        for f in files:
+            fpath = os.path.join(dirpath, f)
+            name = _entry_name(cache, fpath)
+            if name is None: continue
+            _add(name, fpath)
+    return pd.DataFrame(list(entries.values()), columns=['name', 'bytes', 'created', 'last_access', 'files'])
+
+def cache_report(alt_workspace=None, db_folder: Path|None=None) -> pd.DataFrame:
+    """
+    every entry of the pickle cache and every DictCache database,
+    biggest first, with when they were written and last read
+    """
+    df = _cache_entries(alt_workspace).drop(columns=['files'])
+    df.insert(0, 'kind', 'pickle')
+    if db_folder is None: db_folder = WORKSPACE_ROOT.joinpath('data/cache')
+    rows = []
+    for db in sorted(db_folder.glob(f'*{DictCache.EXT}')) if db_folder.exists() else []:
+        st = db.stat()
+        rows.append(dict(kind='DictCache', name=db.stem, bytes=_db_bytes(db), created=st.st_mtime, last_access=max(st.st_atime, st.st_mtime)))
+    df = pd.concat([df, pd.DataFrame(rows, columns=df.columns)], ignore_index=True)
+    for c in ['created', 'last_access']:
+        df[c] = pd.to_datetime(df[c], unit='s')
+    return df.sort_values('bytes', ascending=False).reset_index(drop=True)
+
+def evict(max_bytes: int|None=None, ttl: float|None=None, by: str='last_access', alt_workspace=None, dry_run=False, silent=False) -> list[str]:
+    """
+    removes entries from the pickle cache that haven't been accessed (or, by="created", written)
+    in ttl seconds, then the least recently used ones until the cache fits in max_bytes
+    """
+    assert by in {'last_access', 'created'}
+    df = _cache_entries(alt_workspace).sort_values(by)
+    cutoff = time.time()-ttl if ttl is not None else -np.inf
+    total = df['bytes'].sum()
+    removed = []
+    for _, e in df.iterrows():
+        if e[by] >= cutoff and (max_bytes is None or total <= max_bytes): break
+        total -= e['bytes']
+        removed.append(e['name'])
+        if not silent: print(f"{'would remove' if dry_run else 'removing'} [{e['name']}] {e['bytes']:,} bytes")
+        if dry_run: continue
+        for f in e['files']: os.remove(f)
+    return removed
+
+def _parse_bytes(s: str) -> int:
+    units = dict(K=2**10, M=2**20, G=2**30, T=2**40)
+    s = s.upper().removesuffix('B')
+    return int(float(s[:-1])*units[s[-1]]) if s[-1] in units else int(s)
+
+def _parse_duration(s: str) -> float:
+    units = dict(s=1, m=60, h=3600, d=86400, w=7*86400)
+    return float(s[:-1])*units[s[-1]] if s[-1] in units else float(s)
+
+# #####################################################################################
+# python -m local.caching <command> ...
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(prog="python -m local.caching")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    _recompress = commands.add_parser("recompress", help="train a shared compression dictionary for a DictCache and rewrite its values with it")
+    _recompress.add_argument("name")
+    _recompress.add_argument("--folder", type=Path, default=None)
+    _recompress.add_argument("--samples", type=int, default=4096)
+    _recompress.add_argument("--size", type=int, default=112640, help="dictionary size in bytes")
+
+    _report = commands.add_parser("report", help="list the biggest and least recently used cache entries")
+    _report.add_argument("--workspace", default=None, help="folder containing the pickle cache, defaults to the current directory")
+    _report.add_argument("--folder", type=Path, default=None, help="folder of DictCache databases")
+    _report.add_argument("--top", type=int, default=20)
+
+    _evict = commands.add_parser("evict", help="expire & trim the pickle cache")
+    _evict.add_argument("--workspace", default=None)
+    _evict.add_argument("--max-bytes", type=_parse_bytes, default=None, help="e.g. 20G")
+    _evict.add_argument("--ttl", type=_parse_duration, default=None, help="e.g. 30d")
+    _evict.add_argument("--by", choices=["last_access", "created"], default="last_access")
+    _evict.add_argument("--dry-run", action="store_true")
+
+    _evict_db = commands.add_parser("evict-db", help="expire & trim the rows of a DictCache, then vacuum it")
+    _evict_db.add_argument("name")
+    _evict_db.add_argument("--folder", type=Path, default=None)
+    _evict_db.add_argument("--max-bytes", type=_parse_bytes, default=None)
+    _evict_db.add_argument("--ttl", type=_parse_duration, default=None)
+
+    _vacuum = commands.add_parser("vacuum", help="reclaim free pages of a DictCache")
+    _vacuum.add_argument("name")
+    _vacuum.add_argument("--folder", type=Path, default=None)
+
+    args = parser.parse_args()
+    if args.command == "recompress":
+        with DictCache(args.name, save_folder=args.folder) as dc:
+            before = os.path.getsize(dc.path)
+            dc.train_dictionary(samples=args.samples, size=args.size)
+            dc.recompress()
+            print(f"{dc.path}: {before:,} -> {os.path.getsize(dc.path):,} bytes")
+    elif args.command == "report":
+        df = cache_report(args.workspace, args.folder)
+        with pd.option_context("display.width", 200, "display.max_colwidth", 80):
+            print(f"{df['bytes'].sum():,} bytes in {len(df)} entries\n")
+            print("biggest:")
+            print(df.head(args.top).to_string(index=False))
+            print("\nleast recently used:")
+            print(df.sort_values("last_access").head(args.top).to_string(index=False))
+    elif args.command == "evict":
+        removed = evict(args.max_bytes, args.ttl, args.by, args.workspace, dry_run=args.dry_run)
+        print(f"{len(removed)} entries {'would be ' if args.dry_run else ''}removed")
+    elif args.command in {"evict-db", "vacuum"}:
+        with DictCache(args.name, save_folder=args.folder) as dc:
+            before = os.path.getsize(dc.path)
+            if args.command == "evict-db":
+                print(f"{dc.evict(args.ttl, args.max_bytes)} rows removed")
+            else:
+                dc.vacuum()
+            print(f"{dc.path}: {before:,} -> {os.path.getsize(dc.path):,} bytes")
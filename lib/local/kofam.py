@@ -6,7 +6,7 @@ import pandas as pd
 import os
 
 from local.constants import WORKSPACE_ROOT
-from local.utils import regex
+from local.utils import regex, shrink_frame, imap_batches
 from local.caching import load
 
 # setup kegg orthology
@@ -178,34 +178,116 @@ class Hit:
         else:
             return s > o
 
-def parse_kofam_results(kofam_results: Path):
-    """accepts single file or folder of multiple files"""
-    def parse_hit(l: str):
-        row = [x for x in l[:-1].split(" ")[1:] if x != ""] # just ignore the star, can just look at ratio ourselves
-        desc = " ".join(row[5:])
-        k, ko, thres, score, evalue = row[:5]
-        thres = float(thres) if thres != "-" else None
-        return k, Hit(k, ko, thres, float(score), float(evalue), desc)
-    
+KOFAM_CHUNK = 256*2**20 # bytes of a single file given to one worker
+
+def _orf(l: str):
+    return l[1:].split(None, 1)[0] if not l.startswith("#") else None
+
+def _kofam_ranges(f: Path, chunk: int):
+    """byte ranges of f, cut only between lines of different ORFs so that each ORF's hits stay together"""
+    size = os.path.getsize(f)
+    cuts = [0]
+    with open(f, "rb") as fh:
+        while cuts[-1]+chunk < size:
+            fh.seek(cuts[-1]+chunk)
+            fh.readline() # the rest of a line that started before the cut
+            pos, first = fh.tell(), None
+            while True:
+                l = fh.readline()
+                orf = _orf(l.decode()) if l else None
+                if not l or (orf is not None and first is not None and orf != first): break
+                if first is None: first = orf
+                pos = fh.tell()
+            if pos >= size: break
+            cuts.append(pos)
+    cuts.append(size)
+    return [(f, s, e) for s, e in zip(cuts[:-1], cuts[1:])]
+
+def _frac(thres: float|None, score: float):
+    return score/thres if thres is not None else None
+
+def _better(a: tuple, b: tuple):
+    # Hit.BetterThan, on (threshold, score, ...) tuples
+    s, o = _frac(a[0], a[1]), _frac(b[0], b[1])
+    if s is None or o is None: return a[1] > b[1]
+    return s > o
+
+def _kofam_rows(task: tuple[Path, int, int]):
+    f, start, end = task
+    remaining = end-start
+    with open(f, "rb") as fh:
+        fh.seek(start)
+        for raw in fh:
+            if remaining <= 0: break
+            remaining -= len(raw)
+            if raw.startswith(b"#"): continue
+            yield raw[1:-1].split() # just ignore the star, can just look at ratio ourselves, fields are decoded once kept
+
+def _to_hit(row: list[bytes]):
+    return (float(row[2]) if row[2] != b"-" else None, float(row[3]), row)
+
+def _finish_hit(hit: tuple):
+    thres, score, row = hit
+    return thres, score, float(row[4]), row[1].decode(), b" ".join(row[5:]).decode()
+
+def _best_kofam_hits(task: tuple[Path, int, int]):
+    """the best hit of each ORF in a byte range of one file, as {orf: (threshold, score, evalue, ko, description)}"""
+    best: dict[str, tuple] = {}
+    for row in _kofam_rows(task):
+        k, hit = row[0], _to_hit(row)
+        if k not in best or _better(hit, best[k]):
+            best[k] = hit
+    # the rest of the row is only parsed for the hits that were kept
+    return {k.decode(): _finish_hit(hit) for k, hit in best.items()}
+
+def _best_kofam_hits_batch(tasks: list[tuple[Path, int, int]]):
+    return [_best_kofam_hits(t) for t in tasks]
+
+def _kofam_hits_of_batch(tasks: list[tuple[tuple[Path, int, int], frozenset[str]]]):
+    return [[(row[0].decode(), _finish_hit(_to_hit(row))) for row in _kofam_rows(t) if row[0].decode() in orfs] for t, orfs in tasks]
+
+def parse_kofam_results(kofam_results: Path, shrink=False, workers: int|None=None, chunk: int=KOFAM_CHUNK):
+    """
+    accepts single file or folder of multiple files, shrink applies shrink_frame() to the result.
+    files, and byte ranges of files larger than chunk, are reduced to their best hits on a
+    process pool, then merged in file order, giving the same result as reading them one by one
+    """
+    kofam_results = Path(kofam_results)
     if kofam_results.is_dir():
         files = [f for f in kofam_results.iterdir() if f.is_file() and f.name.endswith(".out")]
         files = sorted(files, key=lambda x: x.stem)
     else:
         files = [kofam_results]
-    best_hits = {}
-    for i, f in enumerate(files):
-        print(f"{i+1} of {len(files)} | {f.name}", end="\r")
-
-        with open(kofam_results.joinpath(f), "r") as fh:
-            for l in fh:
-                if l.startswith("#"): continue
-                k, hit = parse_hit(l)
-                if k not in best_hits or hit.BetterThan(best_hits[k]):
-                    best_hits[k] = hit
+    tasks = [r for f in files for r in _kofam_ranges(f, chunk)]
+    if workers is None: workers = os.cpu_count() or 1
+    best_hits: dict[str, tuple] = {}
+    seen_in: dict[str, int] = {}
+    split: dict[int, set[str]] = {} # ORFs with hits in more than one task
+    for i, (part,) in enumerate(imap_batches(tasks, 1, _best_kofam_hits_batch, workers=min(workers, len(tasks)))):
+        print(f"{i+1} of {len(tasks)} | {tasks[i][0].name}", end="\r")
+        for k, hit in part.items():
+            if k in seen_in:
+                split.setdefault(seen_in[k], set()).add(k)
+                split.setdefault(i, set()).add(k)
+            else:
+                seen_in[k] = i
+                best_hits[k] = hit
     print()
+
+    # comparisons between thresholded & unthresholded hits aren't transitive, so the best of
+    # best hits can differ from the best hit. ORFs split across tasks are redone in order
+    if len(split) > 0:
+        redo = [(tasks[i], frozenset(orfs)) for i, orfs in sorted(split.items())]
+        for k in {k for orfs in split.values() for k in orfs}: del seen_in[k]
+        for (hits,) in imap_batches(redo, 1, _kofam_hits_of_batch, workers=min(workers, len(redo))):
+            for k, hit in hits:
+                if k not in seen_in or _better(hit, best_hits[k]):
+                    best_hits[k] = hit
+                    seen_in[k] = -1
     _rows = []
-    for hit in best_hits.values():
-        _rows.append([hit.k, hit.ko, hit.threshold, hit.score, hit.evalue, hit.description])
+    for k, (thres, score, evalue, ko, desc) in best_hits.items():
+        _rows.append([k, ko, thres, score, evalue, desc])
     df = pd.DataFrame(_rows, columns=["orf", "ko", "hmm_threshold", "score", "evalue", "description"])
+    if shrink: df = shrink_frame(df)
     return df
     # df.to_csv(metag_best_hits, sep="\t", index=False)
@@ -7,7 +7,7 @@ import xmltodict
 import requests
 
 from local.constants import WORKSPACE_ROOT
-from local.caching import load, save, save_exists
+from local.caching import Bundle, load, load_bundle, save_bundle, save_exists
 
 
 def _parse_raw(raw: dict):
@@ -95,7 +95,8 @@ def _parse_raw(raw: dict):
     _set_depth(trees[IS_A], roots[IS_A])
     return ontology, trees, roots[IS_A]
 
-def LoadGo() -> tuple[dict[str, GeneOntology], dict[str, dict[str, str]], list[str]]:
+def LoadGo() -> Bundle:
+    """a lazy bundle of (ontology, trees, roots), members are only read when used, e.g. LoadGo().roots"""
     REF_DIR = WORKSPACE_ROOT.joinpath("data/hierarchies")
     if not REF_DIR.exists(): os.makedirs(REF_DIR, exist_ok=True)
     REF = REF_DIR.joinpath("gene_ontology.owl")
@@ -109,14 +110,16 @@ def LoadGo() -> tuple[dict[str, GeneOntology], dict[str, dict[str, str]], list[s
 
     SNAME = "go_ref"
     if save_exists(SNAME):
-        ontology, trees, roots = load(SNAME)
+        ref = load(SNAME)
+        if isinstance(ref, Bundle): return ref
+        ontology, trees, roots = ref # cached as a tuple before bundles
     else:
         print("parsing...")
         with open(REF) as f:
             raw = xmltodict.parse(f.buffer)
         ontology, trees, roots = _parse_raw(raw)
-        save(SNAME, (ontology, trees, roots))
-    return ontology, trees, roots
+    save_bundle(SNAME, dict(ontology=ontology, trees=trees, roots=roots))
+    return load_bundle(SNAME)
 
 @dataclass
 class GeneOntology:
@@ -1,13 +1,16 @@
 from __future__ import annotations
 import pandas as pd
 import numpy as np
+import os
 import re
 import sys
 from pathlib import Path
 from dataclasses import dataclass
-from typing import Any, Literal
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator, Literal
 from scipy.cluster.hierarchy import to_tree, linkage, ClusterNode, dendrogram
-from scipy.spatial.distance import squareform
+from scipy.spatial.distance import squareform, pdist, cdist, num_obs_y
 
 def safe_log10(x):
     if isinstance(x, np.ndarray):
@@ -22,16 +25,102 @@ def pd_set_type(cols: list|str, t, df: pd.DataFrame):
     if isinstance(cols, str): cols = cols.split(', ')
     for col in cols: df[col] = df[col].astype(t)
 
+def shrink_frame(df: pd.DataFrame, max_category_ratio: float=0.5, lossy_floats=False, unsigned=False, silent=False) -> pd.DataFrame:
+    """
+    a copy of df with string columns with few distinct values (at most max_category_ratio of
+    the rows) as categories and numbers in the smallest type that holds them. floats are only
+    made float32 when that doesn't change any value, unless lossy_floats. ints stay signed,
+    since arithmetic on unsigned columns wraps instead of going negative, unless unsigned
+    """
+    before = df.memory_usage(deep=True).sum()
+    df = df.copy()
+    for c in df.columns:
+        col = df[c]
+        kind = col.dtype.kind
+        if isinstance(col.dtype, pd.StringDtype) or (kind == "O" and pd.api.types.infer_dtype(col, skipna=True) == "string"):
+            # other object columns, e.g. of lists or mixed types, are left as they are
+            if len(col) > 0 and col.nunique(dropna=False) <= max_category_ratio*len(col):
+                df[c] = col.astype("category")
+        elif kind in "iu":
+            df[c] = pd.to_numeric(col, downcast="unsigned" if unsigned and len(col) > 0 and col.min() >= 0 else "integer")
+        elif kind == "f" and col.dtype.itemsize > 4:
+            small = col.astype(np.float32)
+            if lossy_floats or np.array_equal(small.to_numpy(np.float64), col.to_numpy(), equal_nan=True):
+                df[c] = small
+    after = df.memory_usage(deep=True).sum()
+    if not silent: print(f"shrank frame from {before/2**20:.1f} to {after/2**20:.1f} MiB ({before/max(after, 1):.1f}x)")
+    return df
+
 def regex(r, s):
     for m in re.finditer(r, s):
         yield s[m.start():m.end()]
 
 # https://stackoverflow.com/questions/8290397/how-to-split-an-iterable-in-constant-size-chunks
 def batchify(iterable, n=1):
+    """slices of sequences & DataFrames, or lists taken lazily from any other iterable"""
+    if not (hasattr(iterable, "__len__") and hasattr(iterable, "__getitem__")):
+        it = iter(iterable)
+        while len(batch := list(islice(it, n))) > 0:
+            yield batch
+        return
     l = len(iterable)
     for ndx in range(0, l, n):
         yield iterable[ndx:min(ndx + n, l)]
 
+class BatchError(Exception):
+    """raised from imap_batches, with the failed batch & its position. the cause is the original error"""
+    def __init__(self, index: int, start: int, batch: Any, e: BaseException) -> None:
+        super().__init__(f"batch {index} (items {start} to {start+len(batch)-1}) failed with {type(e).__name__}: {e}")
+        self.index, self.start, self.batch = index, start, batch
+
+def imap_batches[T, R](iterable: Iterable[T], n: int, fn: Callable[[list[T]], R], workers: int|None=None, backend: Literal["process", "thread"]="process", ordered=True, max_inflight: int|None=None, initializer: Callable|None=None, initargs: tuple=()) -> Iterator[R]:
+    """
+    yields fn(batch) for batches of n items, read lazily from any iterable. at most max_inflight
+    batches (2 per worker by default) are read ahead of the consumer. if not ordered, results are
+    yielded as they finish. for the process backend, fn & the batches must be picklable.
+    initializer(*initargs) is run once in each worker (or here, if workers <= 1).
+    errors are raised as BatchError
+    """
+    if workers is None: workers = os.cpu_count() or 1
+    if max_inflight is None: max_inflight = 2*workers
+    def _batches():
+        start = 0
+        for i, batch in enumerate(batchify(iterable, n)):
+            yield i, start, batch
+            start += len(batch)
+
+    if workers <= 1:
+        if initializer is not None: initializer(*initargs)
+        for i, start, batch in _batches():
+            try:
+                r = fn(batch)
+            except Exception as e:
+                raise BatchError(i, start, batch, e) from e
+            yield r
+        return
+
+    Pool = ProcessPoolExecutor if backend == "process" else ThreadPoolExecutor
+    with Pool(max_workers=workers, initializer=initializer, initargs=initargs) as pool:
+        pending: dict[Future, tuple[int, int, Any]] = {}
+        def _collect():
+            if ordered:
+                done = [next(iter(pending))]
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                i, start, batch = pending.pop(f)
+                e = f.exception()
+                if e is not None:
+                    for other in pending: other.cancel()
+                    raise BatchError(i, start, batch, e) from e
+                yield f.result()
+        for i, start, batch in _batches():
+            pending[pool.submit(fn, batch)] = (i, start, batch)
+            while len(pending) >= max_inflight:
+                yield from _collect()
+        while len(pending) > 0:
+            yield from _collect()
+
 def add_to_python_path(paths: list[Path|str]):
     if not isinstance(paths, list): paths = [paths]
     sys.path = list(set(sys.path + [str(p) for p in paths]))
@@ -48,16 +137,50 @@ class LabelGroup[T]:
     def GetAny(self):
         return self.group[0]
     
-def Deduplicate(z: np.ndarray, labels: list):
-    row_groups = {}
+def _row_keys(z: np.ndarray):
+    """each row as one opaque void scalar, so rows compare & sort by their bytes"""
+    z = np.ascontiguousarray(z).reshape(len(z), -1)
+    if z.dtype.kind in "fc": z = z+z.dtype.type(0) # -0.0 == 0.0, as with tuples
+    return z.view(np.dtype((np.void, z.dtype.itemsize*z.shape[1])))[:, 0]
+
+def Deduplicate(z: np.ndarray, labels: list, compact: bool=False):
+    """
+    groups identical rows, in order of each group's first occurrence.
+    returns the first row of each group, and either a LabelGroup per group or,
+    if compact, an array of the group index of each row.
+    unlike tuple keys, NaNs with the same bit pattern count as equal
+    """
+    z = np.asarray(z)
+    if z.dtype.kind == "O" or len(z) == 0 or z.size == 0:
+        return _deduplicate_rows(z, labels, compact)
+    _, first, inverse = np.unique(_row_keys(z), return_index=True, return_inverse=True)
+    order = np.argsort(first) # np.unique sorts by value, renumber groups by first occurrence
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    groups = rank[inverse.reshape(-1)]
+    if compact: return z[first[order]], groups
+
+    members = np.argsort(groups, kind="stable").tolist()
+    bounds = np.cumsum(np.bincount(groups)).tolist()
+    ulabels, start = [], 0
+    for gi, end in enumerate(bounds):
+        groupi = members[start:end]
+        ulabels.append(LabelGroup(index=gi, group=[labels[i] for i in groupi], groupi=groupi))
+        start = end
+    return z[first[order]], ulabels
+
+def _deduplicate_rows(z: np.ndarray, labels: list, compact: bool):
+    # rows that can't be viewed as bytes, e.g. of python objects
+    row_groups: dict[tuple, list[int]] = {}
     for i, row in enumerate(z):
-        label = labels[i]
-        k = tuple(row)
-        row_groups[k] = row_groups.get(k, [])+[(label, i)]
-    unique_rows = [g[0][1] for g in row_groups.values()]
-    z = z[unique_rows]
-    ulabels = [LabelGroup(index=i, group=[l for l, i in g], groupi=[i for l, i in g]) for i, g in enumerate(row_groups.values())]
-    return z, ulabels
+        row_groups.setdefault(tuple(row), []).append(i)
+    unique_rows = [g[0] for g in row_groups.values()]
+    if compact:
+        groups = np.empty(len(z), dtype=np.intp)
+        for gi, g in enumerate(row_groups.values()): groups[g] = gi
+        return z[unique_rows], groups
+    ulabels = [LabelGroup(index=gi, group=[labels[i] for i in g], groupi=g) for gi, g in enumerate(row_groups.values())]
+    return z[unique_rows], ulabels
 
 @dataclass
 class DendrogramNode[T]:
@@ -76,22 +199,118 @@ class DendrogramNode[T]:
                 yield c
 
     def Traverse(self, order="in"):
-        if self.IsLeaf():
-            yield self
-            return
-        
-        left, right = self.Children()
-        todo = {
-            "pre": [self, left, right],
-            "in": [left, self, right],
-            "post": [left, right, self]
-        }[order]
-        for x in todo:
-            if x == self:
-                yield self
-            else:
-                yield from x.Traverse(order)
-    
+        def children(n: DendrogramNode):
+            return None if n.IsLeaf() else (n.left, n.right)
+        yield from _traverse(self, children, order)
+
+def _traverse(root, children, order: str):
+    """iterative pre, in or post-order traversal, children(n) is (left, right) or None for leaves"""
+    assert order in {"pre", "in", "post"}, f"unknown order [{order}]"
+    todo = [(root, False)]
+    while len(todo) > 0:
+        n, ready = todo.pop()
+        ch = None if ready else children(n)
+        if ch is None:
+            yield n
+            continue
+        left, right = ch
+        if order == "pre":
+            todo += [(right, False), (left, False), (n, True)]
+        elif order == "in":
+            todo += [(right, False), (n, True), (left, False)]
+        else:
+            todo += [(n, True), (right, False), (left, False)]
+
+@dataclass
+class DendrogramArrays[T]:
+    """
+    a dendrogram as parallel arrays indexed by node id, with -1 for the children of leaves.
+    i is the leaf's index into labels, or the link number of internal nodes, as in DendrogramNode
+    """
+    left: np.ndarray
+    right: np.ndarray
+    x: np.ndarray
+    y: np.ndarray
+    i: np.ndarray
+    root: int
+    labels: list[T]
+
+    def __post_init__(self):
+        self._nodes: dict[int, _ArrayNode] = {}
+
+    def __len__(self):
+        return len(self.left)
+
+    def IsLeaf(self, k: int):
+        return self.left[k] < 0
+
+    def Leaves(self):
+        return np.flatnonzero(self.left < 0)
+
+    def Traverse(self, order="in", start: int|None=None):
+        """ids of the nodes under start, the root by default"""
+        left, right = self.left.tolist(), self.right.tolist()
+        start = self.root if start is None else start
+        yield from _traverse(start, lambda k: None if left[k] < 0 else (left[k], right[k]), order)
+
+    def Normalize(self):
+        """min-max scales x & y to [0, 1] in place"""
+        for a in [self.x, self.y]:
+            lo, hi = a.min(), a.max()
+            a -= lo
+            a /= hi-lo
+
+    def Node(self, k: int) -> DendrogramNode[T]:
+        """a DendrogramNode view of node k, whose children are only made when accessed"""
+        node = self._nodes.get(k)
+        if node is None:
+            node = self._nodes[k] = _ArrayNode(self, k)
+        return node
+
+    @classmethod
+    def FromNodes(cls, root: DendrogramNode[T], labels: list[T]):
+        nodes = list(root.Traverse("pre"))
+        ids = {id(n): k for k, n in enumerate(nodes)}
+        child = lambda c: ids[id(c)] if c is not None else -1
+        return cls(
+            left=np.array([child(n.left) for n in nodes], dtype=np.intp),
+            right=np.array([child(n.right) for n in nodes], dtype=np.intp),
+            x=np.array([n.x for n in nodes], dtype=float),
+            y=np.array([n.y for n in nodes], dtype=float),
+            i=np.array([n.i for n in nodes], dtype=np.intp),
+            root=0, labels=labels,
+        )
+
+class _ArrayNode[T](DendrogramNode[T]):
+    # reads & writes go through to the arrays, so changes made via nodes are kept
+    def __init__(self, arrays: DendrogramArrays[T], k: int) -> None:
+        self._arrays, self._k = arrays, k
+
+    def _child(self, side: str):
+        k = getattr(self._arrays, side)[self._k]
+        return self._arrays.Node(int(k)) if k >= 0 else None
+
+    def _set_child(self, side: str, node: _ArrayNode[T]|None):
+        assert node is None or (isinstance(node, _ArrayNode) and node._arrays is self._arrays), "can only link nodes of the same arrays"
+        getattr(self._arrays, side)[self._k] = node._k if node is not None else -1
+
+    def _set(self, field: str, v):
+        getattr(self._arrays, field)[self._k] = v
+
+    x = property(lambda self: float(self._arrays.x[self._k]), lambda self, v: self._set("x", v)) # type: ignore
+    y = property(lambda self: float(self._arrays.y[self._k]), lambda self, v: self._set("y", v)) # type: ignore
+    i = property(lambda self: int(self._arrays.i[self._k]), lambda self, v: self._set("i", v)) # type: ignore
+    name = property(lambda self: self._arrays.labels[self.i] if self._arrays.IsLeaf(self._k) else None) # type: ignore
+    left = property(lambda self: self._child("left"), lambda self, v: self._set_child("left", v)) # type: ignore
+    right = property(lambda self: self._child("right"), lambda self, v: self._set_child("right", v)) # type: ignore
+
+    def IsLeaf(self):
+        return self._arrays.IsLeaf(self._k)
+
+    def Traverse(self, order="in"):
+        for k in self._arrays.Traverse(order, self._k):
+            yield self._arrays.Node(k)
+
 @dataclass
 class LinkageResult[T]:
     labels: list[T]
@@ -100,14 +319,104 @@ class LinkageResult[T]:
     tree: DendrogramNode
     root_distance: float
     linkage: Any
+    arrays: DendrogramArrays[T]|None = None
+
+# #####################################################################################
+# distances
+
+def _condensed_start(i, n: int):
+    # position of (i, i+1) in the condensed distances of n observations
+    return i*n - i*(i+1)//2
+
+_distance_state: dict[str, Any] = {}
+def _distance_init(X: np.ndarray, metric: str, dtype, out: str|None, kwargs: dict):
+    _distance_state.update(X=X, metric=metric, dtype=dtype, out=out, kwargs=kwargs)
+
+def _distance_block(rows: tuple[int, int]):
+    X, metric, dtype, out, kwargs = (_distance_state[k] for k in ["X", "metric", "dtype", "out", "kwargs"])
+    i0, i1 = rows
+    n = len(X)
+    d = cdist(X[i0:i1], X[i0:], metric=metric, **kwargs)
+    slab = np.concatenate([d[r, r+1:] for r in range(i1-i0)]).astype(dtype, copy=False)
+    if out is None: return slab
+    mm = np.lib.format.open_memmap(out, mode="r+")
+    mm[_condensed_start(i0, n):_condensed_start(i1, n)] = slab
+    mm.flush()
+
+def _distance_blocks(batch: list[tuple[int, int]]):
+    return [(rows, _distance_block(rows)) for rows in batch]
 
-def HierarchicalCluster(Z: np.ndarray, labels: list|None = None, method="ward", metric="euclidean", distance_sort=False, count_sort=False, sort_order=None) -> LinkageResult:
+def condensed_distances(X: np.ndarray, metric="euclidean", dtype=np.float32, out: str|Path|None=None, workers: int|None=None, block: int=2**22) -> np.ndarray:
     """
-    method: [single, complete, average, weighted, centroid, median, ward]
-    https://docs.scipy.org/doc/scipy/reference/generated/scipy.cluster.hierarchy.linkage.html
-    
-    metric: https://docs.scipy.org/doc/scipy/reference/generated/scipy.spatial.distance.pdist.html#scipy.spatial.distance.pdist 
+    the same as pdist(X, metric), as dtype, computed in blocks of consecutive rows on a process pool.
+    each block is about block distances and is written straight into the result, so memory is
+    bounded by the condensed result plus two blocks per worker. if out is given, the result
+    is a memmap of an .npy file at that path, which can be reopened with np.load(out, mmap_mode="r").
+    for seuclidean & mahalanobis, V & VI are estimated once from all of X, as pdist does
     """
+    if workers is None: workers = os.cpu_count() or 1
+    n = len(X)
+    m = n*(n-1)//2
+    # cdist would estimate these from each block's rows only
+    kwargs = {}
+    if metric == "seuclidean":
+        kwargs["V"] = np.var(X, axis=0, ddof=1)
+    elif metric == "mahalanobis":
+        kwargs["VI"] = np.linalg.inv(np.cov(np.asarray(X, dtype=np.float64).T)).T.copy()
+    if out is not None:
+        out = str(out)
+        result = np.lib.format.open_memmap(out, mode="w+", dtype=dtype, shape=(m,))
+    else:
+        result = np.empty(m, dtype=dtype)
+    # split rows so that each block covers about the same number of distances
+    starts = _condensed_start(np.arange(n+1), n)
+    bounds = np.unique(np.searchsorted(starts, np.arange(0, m, max(block, 1)), side="right")-1)
+    bounds = np.append(bounds[bounds < n], n)
+    blocks = list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+    workers = min(workers, len(blocks))
+    for done in imap_batches(blocks, 1, _distance_blocks, workers=workers, initializer=_distance_init, initargs=(X, metric, dtype, out, kwargs)):
+        for rows, slab in done:
+            if slab is not None: result[_condensed_start(rows[0], n):_condensed_start(rows[1], n)] = slab
+    if out is not None:
+        result.flush()
+        result = np.load(out, mmap_mode="r")
+    return result
+
+def _greedy_leaf_ordering(linkage_data: np.ndarray, y: np.ndarray):
+    """
+    the linkage with each merge's children swapped so that, bottom up, the two leaves that
+    become neighbours at each merge are as close as possible given the orders below it
+    """
+    n = num_obs_y(y)
+    def dist(i: int, j: int):
+        if i > j: i, j = j, i
+        return y[_condensed_start(i, n)+j-i-1]
+    Zl = np.array(linkage_data)
+    children = Zl[:, :2].astype(np.intp).tolist()
+    ends = [(k, k) for k in range(n)] + [(0, 0)]*(n-1) # (leftmost, rightmost) leaf in its own orientation
+    flips: list[tuple[bool, bool]] = []
+    for c, (a, b) in enumerate(children, start=n):
+        (al, ar), (bl, br) = ends[a], ends[b]
+        # (flip a, flip b) by the distance between the leaves that end up next to each other
+        options = [(dist(ar, bl), False, False), (dist(al, bl), True, False), (dist(ar, br), False, True), (dist(al, br), True, True)]
+        _, fa, fb = min(options, key=lambda o: o[0])
+        ends[c] = (ar if fa else al, bl if fb else br)
+        flips.append((fa, fb))
+
+    # resolve flips top down, a flipped node shows its children in reverse order & each of them flipped
+    flipped = [False]*(2*n-1)
+    for c in range(2*n-2, n-1, -1):
+        (a, b), (fa, fb) = children[c-n], flips[c-n]
+        flipped[a], flipped[b] = flipped[c] ^ fa, flipped[c] ^ fb
+        if flipped[c]: Zl[c-n, :2] = b, a
+        else: Zl[c-n, :2] = a, b
+    return Zl
+
+# #####################################################################################
+
+def _tree_from_dendrogram(linkage_data: np.ndarray, labels: list, count_sort, distance_sort):
+    """the tree recovered by matching up the link coordinates of scipy's dendrogram()"""
     class FloatDict[U]:
         def __init__(self, d: dict[float, U] = dict()):
             self.d = d
@@ -153,12 +462,6 @@ def HierarchicalCluster(Z: np.ndarray, labels: list|None = None, method="ward",
             zero = 1.0e-4
             return abs(self.x - x) < zero and abs(self.y - y) < zero
 
-    # ###############################################################
-    # use scipy to do the clustering
-    labels = list(labels) if labels is not None else list(range(Z.shape[0]))
-    _Z = Z
-    if metric=="precomputed": _Z = squareform(Z)
-    linkage_data = linkage(_Z, method=method, metric=metric, optimal_ordering=False)
     _p: Any = dict(count_sort=count_sort, distance_sort=distance_sort) # to bypass type warning
     dend = dendrogram(linkage_data, no_plot=True, labels=list(range(len(labels))), **_p)
 
@@ -208,7 +511,6 @@ def HierarchicalCluster(Z: np.ndarray, labels: list|None = None, method="ward",
         _root = n
     assert _root is not None
 
-    root_dist = _root.y
     root = DendrogramNode(_root.x, _root.y, _root.i)
     todo: list[DendrogramNode] = [root]
     label_index = 0
@@ -235,42 +537,121 @@ def HierarchicalCluster(Z: np.ndarray, labels: list|None = None, method="ward",
             setattr(new, ch, new_child)
             todo.append(new_child)
     
+    return root, clust_orderi
+
+def _tree_from_linkage(linkage_data: np.ndarray, labels: list, count_sort, distance_sort):
+    """
+    the same tree as _tree_from_dendrogram, in O(n), with node ids as in the linkage matrix.
+    children are ordered as dendrogram() orders them, leaves are at x = 5, 15, 25, ...,
+    internal nodes centered over their children and numbered in the order dendrogram()
+    emits their links (post-order)
+    """
+    n = len(labels)
+    Zl = np.asarray(linkage_data)
+    za, zb = Zl[:, 0].astype(np.intp).tolist(), Zl[:, 1].astype(np.intp).tolist()
+    zh, zn = Zl[:, 2].tolist(), Zl[:, 3].tolist()
+    def size(c): return 1 if c < n else zn[c-n]
+    def height(c): return 0.0 if c < n else zh[c-n]
+    def ordered(c):
+        a, b = za[c-n], zb[c-n]
+        if count_sort == "ascending" or count_sort is True:
+            return (b, a) if size(a) > size(b) else (a, b)
+        if count_sort == "descending":
+            return (a, b) if size(a) > size(b) else (b, a)
+        if distance_sort == "ascending" or distance_sort is True:
+            return (b, a) if height(a) > height(b) else (a, b)
+        if distance_sort == "descending":
+            return (a, b) if height(a) > height(b) else (b, a)
+        return a, b
+
+    N = 2*n-1
+    left, right = [-1]*N, [-1]*N
+    x, i = [0.0]*N, list(range(n))+[0]*(n-1)
+    for c in range(n, N): left[c], right[c] = ordered(c)
+    clust_orderi: list[int] = []
+    link_i = 0
+    for c in _traverse(N-1, lambda c: None if c < n else (left[c], right[c]), "post"):
+        if c < n:
+            x[c] = 5.0+10*len(clust_orderi)
+            clust_orderi.append(c)
+        else:
+            x[c] = (x[left[c]]+x[right[c]])/2
+            i[c] = link_i
+            link_i += 1
+    y = np.zeros(N)
+    y[n:] = Zl[:, 2]
+    arrays = DendrogramArrays(
+        left=np.array(left, dtype=np.intp), right=np.array(right, dtype=np.intp),
+        x=np.array(x), y=y, i=np.array(i, dtype=np.intp), root=N-1, labels=labels,
+    )
+    return arrays, clust_orderi
+
+def HierarchicalCluster(Z: np.ndarray, labels: list|None = None, method="ward", metric="euclidean", distance_sort=False, count_sort=False, sort_order=None, build: Literal["linkage", "dendrogram"]="linkage", leaf_ordering: Literal["optimal", "greedy"]|None=None) -> LinkageResult:
+    """
+    method: [single, complete, average, weighted, centroid, median, ward]
+    https://docs.scipy.org/doc/scipy/reference/generated/scipy.cluster.hierarchy.linkage.html
+    
+    metric: https://docs.scipy.org/doc/scipy/reference/generated/scipy.spatial.distance.pdist.html#scipy.spatial.distance.pdist 
+    or "precomputed", for a square distance matrix or condensed distances, see condensed_distances()
+
+    build: "linkage" reads the tree straight from the linkage matrix, "dendrogram" recovers
+    it from the coordinates of scipy's dendrogram(), which is slower & can mismatch nodes
+    when merges coincide
+
+    leaf_ordering: flips subtrees so that neighbouring leaves are similar, unless count_sort
+    or distance_sort reorder them afterwards. "optimal" is scipy's optimal_ordering, which
+    is exact but slow past a few thousand leaves, "greedy" only compares the leaves that
+    meet where two subtrees are joined, in O(n)
+    """
+    # ###############################################################
+    # use scipy to do the clustering
+    condensed = metric=="precomputed" and Z.ndim == 1
+    n = num_obs_y(Z) if condensed else Z.shape[0]
+    labels = list(labels) if labels is not None else list(range(n))
+    _Z = Z
+    if metric=="precomputed" and not condensed: _Z = squareform(Z, checks=False)
+    _metric = metric
+    if leaf_ordering == "greedy" and metric!="precomputed": # what linkage would do, but kept for the reordering
+        _Z, _metric = pdist(Z, metric=metric), "precomputed"
+    linkage_data = linkage(_Z, method=method, metric=_metric, optimal_ordering=leaf_ordering=="optimal")
+    if leaf_ordering == "greedy": linkage_data = _greedy_leaf_ordering(linkage_data, _Z)
+    if build == "linkage":
+        arrays, clust_orderi = _tree_from_linkage(linkage_data, labels, count_sort, distance_sort)
+    else:
+        _root, clust_orderi = _tree_from_dendrogram(linkage_data, labels, count_sort, distance_sort)
+        arrays = DendrogramArrays.FromNodes(_root, labels)
+    root = arrays.Node(arrays.root)
+    clust_order = [labels[i] for i in clust_orderi]
+    root_dist = root.y
+
     # ###############################################################
     # sync matrix order to clustering
 
-    Z = Z[clust_orderi]
-    if metric=="precomputed": Z = Z.T[clust_orderi].T
+    # condensed distances are returned as given, rather than expanded to a square matrix
+    if condensed: mat = Z
+    elif metric=="precomputed": mat = Z[np.ix_(clust_orderi, clust_orderi)]
+    else: mat = Z[clust_orderi]
 
     # ###############################################################
     # order, if given
 
     if sort_order is not None:
-        _pos = {}
-        def update_pos(n: DendrogramNode):
-            if n.i not in _pos:
-                if n.IsLeaf():
-                    _positions = [sort_order[n.i]]
-                    _pos[n.i] = _positions
-                else:
-                    _positions = update_pos(n.left) + update_pos(n.right)
-                    _pos[n.i] = _positions
-                    if n.left.x > n.right.x:
-                        n.left, n.right = n.right, n.left
-            _positions = _pos[n.i]
-            n.x = sum(_positions)/len(_positions)
-            return _pos[n.i]
-        update_pos(root)
+        # each node at the mean sort_order of its leaves, with the lower child on the left
+        left, right, i = arrays.left.tolist(), arrays.right.tolist(), arrays.i.tolist()
+        total, count = [0.0]*len(arrays), [0]*len(arrays)
+        for k in arrays.Traverse("post"):
+            l, r = left[k], right[k]
+            if l < 0:
+                total[k], count[k] = float(sort_order[i[k]]), 1
+                continue
+            total[k], count[k] = total[l]+total[r], count[l]+count[r]
+            if total[l]/count[l] > total[r]/count[r]: left[k], right[k] = r, l
+        arrays.left[:], arrays.right[:] = left, right
+        arrays.x[:] = np.array(total)/np.array(count)
 
     # ###############################################################
     # normalize positions
 
-    max_x, min_x, = -np.inf, np.inf
-    max_y, min_y, = -np.inf, np.inf
-    for node in root.Traverse():
-        min_x, max_x = min(min_x, node.x), max(max_x, node.x)
-        min_y, max_y = min(min_y, node.y), max(max_y, node.y)
-    for node in root.Traverse():
-        node.x = float((node.x - min_x) / (max_x - min_x))
-        node.y = float((node.y - min_y) / (max_y - min_y))
+    arrays.Normalize()
 
-    return LinkageResult(clust_order, clust_orderi, Z[clust_orderi], root, root_dist, linkage_data)
\ No newline at end of file
+    return LinkageResult(clust_order, clust_orderi, mat, root, root_dist, linkage_data, arrays)
\ No newline at end of file
@@ -1,5 +1,6 @@
 from pyexpat import ExpatError
 import time
+import functools
 import requests
 import xmltodict    
 from typing import Any
@@ -41,6 +42,14 @@ def chain_get(d: dict, path: list|str) -> Any:
 with open(WORKSPACE_ROOT.joinpath("secrets/ncbi_apikey")) as f:
     API_KEY = f.readline().replace("\n", "").strip()
 
+# decoded responses kept in memory across calls, see DictCache
+NCBI_MEMORY_BUDGET = 256*2**20
+
+@functools.cache
+def _ncbi_cache():
+    # one for the whole process, since opening a DictCache isn't free & it's safe to share between threads
+    return DictCache("ncbi_requests", memory_budget=NCBI_MEMORY_BUDGET)
+
 def ncbi_get(action: str, db: str|None=None, params: list[tuple[str, str]]=list(), retry=False):
     base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
     for k, v in params:
@@ -55,26 +64,26 @@ def ncbi_get(action: str, db: str|None=None, params: list[tuple[str, str]]=list(
     url=f"{base_url}/{action}.fcgi?"+"&".join(base+[
         f"{k}={urllib.parse.quote(v)}" for k, v in params
     ])
-    with DictCache("ncbi_requests") as request_cache:
-        _s = url.index("api_key")
-        _e = url.index("&", _s)+1
-        ckey = url[:_s]+url[_e:]
-        ckey = ckey.replace(base_url, "")
-        _cached_r = request_cache.get(ckey)
-        if retry or _cached_r is None:
-            time.sleep(0.1)
-            r = requests.get(url)
-            try:
-                d: dict = xmltodict.parse(r.text)
-            except ExpatError as e:
-                print(f"{e}")
-                print(f"{r.text}")
-                return "xml format", r.text
-            if r.status_code != 200: return r.status_code, d
-            request_cache[ckey] = dict(status_code = r.status_code, data=d)
-        else:
-            d: dict = _cached_r["data"]
-        return 200, d
+    request_cache = _ncbi_cache()
+    _s = url.index("api_key")
+    _e = url.index("&", _s)+1
+    ckey = url[:_s]+url[_e:]
+    ckey = ckey.replace(base_url, "")
+    _cached_r = request_cache.get(ckey)
+    if retry or _cached_r is None:
+        time.sleep(0.1)
+        r = requests.get(url)
+        try:
+            d: dict = xmltodict.parse(r.text)
+        except ExpatError as e:
+            print(f"{e}")
+            print(f"{r.text}")
+            return "xml format", r.text
+        if r.status_code != 200: return r.status_code, d
+        request_cache[ckey] = dict(status_code = r.status_code, data=d)
+    else:
+        d: dict = _cached_r["data"]
+    return 200, d
 
 def ncbi_search(query: str, db: str, response_type: str="esummary", 
                 search_params: list[tuple[str, str]]=list(), 